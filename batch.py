@@ -1,65 +1,160 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import time
+_start = time.perf_counter()  # before any other import, to measure the start-up of each action
+
 import argparse
-import pandas as pd
-import shutil
-from batch.collect import collect
-from batch.collect_votes import collect_votes
+import importlib
+from batch.assignment import for_assignments, has_homework, select_assignments
 from batch.constants import *
-from batch.late_chip import calc_late_days
-from batch.generate_rubric import generate_rubric
-from batch.grade import grade
-from batch.make import make
-from batch.pull import pull
-from batch.push import push
+from batch.digest import file_digest
+from batch.journal import DONE, PENDING, Journal
+from batch import metrics
+from batch.pool import map_repos
+from batch.sandbox import install_solutions
+from batch.summary import load_summary, save_summary
 
+# Action -> module.function; only the module of the chosen action is imported
 DISPATCH = {
-    'collect': collect,
-    'collect-votes': collect_votes,
-    'generate-rubric': generate_rubric,
-    'grade': grade,
-    'late-chip': calc_late_days,
-    'make': make,
-    'pull': pull,
-    'push': push,
+    'collect': 'batch.collect.collect',
+    'collect-votes': 'batch.collect_votes.collect_votes',
+    'generate-rubric': 'batch.generate_rubric.generate_rubric',
+    'grade': 'batch.grade.grade',
+    'late-chip': 'batch.late_chip.calc_late_days',
+    'make': 'batch.make.make',
+    'pipeline': 'batch.pipeline.pipeline',
+    'pull': 'batch.pull.pull',
+    'push': 'batch.push.push',
+    'rescore': 'batch.rescore.rescore',
+    'similarity': 'batch.similarity.similarity',
+}
+
+# Variants of actions that take a list of repositories at once, used with --batch-size
+BATCH_DISPATCH = {
+    'grade': 'batch.grade.grade_batch',
+}
+
+# Summary column that receives the return values of an action, for homework {hw}
+RESULT_COLUMNS = {
+    'collect': '{hw}_alias',
+    'grade': '{hw}',
+    'late-chip': '{hw}_late_chip',
+    'pipeline': '{hw}',
+    'rescore': '{hw}',
+}
+
+# Actions that take their homework from the context, so --hw can select one or several
+ASSIGNMENT_ACTIONS = ['generate-rubric', 'grade', 'late-chip', 'pipeline', 'push', 'rescore']
+
+# Actions that are safe to run on several repositories at once, and whether their workers are threads
+PARALLEL_ACTIONS = {
+    'collect': True,
+    'grade': False,
+    'make': True,
+    'pull': True,
+    'push': True,
+    'similarity': False,
 }
 
+# Actions whose process workers each need their own copy of elm-tester
+SANDBOX_ACTIONS = ['grade']
+
 
 def main():
     parser = argparse.ArgumentParser(description='Batch operations for SVN repositories.')
     parser.add_argument('action', help='pull, grade or push')
-    parser.add_argument('-f', '--force', help='grade, generate_rubric only. ignore existing grading',
+    parser.add_argument('-b', '--batch-size', help='grade only. number of submissions to test in one elm-test run',
+                        type=int, default=1)
+    parser.add_argument('--changed', help='for all. only process the repositories the last pull changed',
+                        action='store_true')
+    parser.add_argument('-f', '--force', help='grade, generate_rubric, pull only. ignore existing grading or revisions',
                         action='store_true')
+    parser.add_argument('--hw', help='{0} only. comma-separated homeworks of {1} to process in one pass, '
+                                     'default {2}'.format(', '.join(ASSIGNMENT_ACTIONS), os.path.basename(ASSIGNMENTS_PATH), HW_DIR))
+    parser.add_argument('-j', '--jobs', help='collect, grade, make, pull, push, similarity only. number of repositories to process in parallel',
+                        type=int, default=1)
+    parser.add_argument('-m', '--metrics', help='for all. record phase timings to this JSON lines file, '
+                                                'or CSV file if it ends in .csv, and print a summary')
     parser.add_argument('-n', '--limit', help='for all. limit the number of repositories to process', type=int)
     parser.add_argument('-o', '--open', help='make only. open the Elm target after making', action='store_true')
+    parser.add_argument('--resume', help='for all. only process repositories the previous run did not finish',
+                        action='store_true')
     parser.add_argument('-r', '--repo', help='for all. run command on this specific repository')
+    parser.add_argument('--stage-jobs', help='pipeline only. workers per stage, e.g. pull=8,grade=4,push=8')
     parser.add_argument('-s', '--skip', help='for all. skip the first SKIP repositories', type=int, default=0)
+    parser.add_argument('--svn-url', help='pull only. URL prefix of the SVN repositories', default=SVN_URL_PREFIX)
+    parser.add_argument('-t', '--timeout', help='grade only. wall-clock limit per submission in seconds',
+                        type=float, default=TEST_TIMEOUT)
     args = parser.parse_args()
+    run_id = None
+    if args.metrics is not None:
+        run_id = metrics.start_run(args.action, METRICS_PATH if args.metrics.endswith('.csv') else args.metrics)
 
     # Dispatch function
-    fn = DISPATCH.get(args.action, None)
-    if fn is None:
+    if args.action not in DISPATCH:
         raise RuntimeError("> Don't know how to '{0}'".format(args.action))
+    fn = __load(DISPATCH[args.action])
+    metrics.record('import', time.perf_counter() - _start)
+
+    if args.jobs > 1 and args.action not in PARALLEL_ACTIONS:
+        raise RuntimeError("> Cannot run '{0}' in parallel".format(args.action))
+    if args.batch_size > 1 and args.action not in BATCH_DISPATCH:
+        raise RuntimeError("> Cannot run '{0}' in batches".format(args.action))
+    stage_jobs = __parse_stage_jobs(args.stage_jobs) if args.action == 'pipeline' else None
+    assignments = select_assignments(args.hw)
+    if args.action not in ASSIGNMENT_ACTIONS and [assignment.hw_dir for assignment in assignments] != [HW_DIR]:
+        raise RuntimeError("> '{0}' only runs for {1}".format(args.action, HW_DIR))
+    if len(assignments) > 1 and args.batch_size > 1:
+        raise RuntimeError('> Cannot run several homeworks in batches')
 
     # Pre-routine for action
+    # Check the tests once, before grading anyone
+    if args.action in ('grade', 'pipeline', 'rescore'):
+        import grader
+        for assignment in assignments:
+            manifest = grader.load_manifest(os.path.join(assignment.tests_path, TESTS_FILENAME))
+            print("> {0}: {1} tests, {2} points".format(manifest['name'], len(manifest['tests']), manifest['total']))
     # Copy the solutions into elm-tester directory
-    if args.action == 'grade':
-        for solution in SOLUTION_FILES:
-            shutil.copy(os.path.join(TESTS_DIR, HW_DIR, 'solution', solution), os.path.join(ELM_TESTER_DIR, 'tests'))
+    if args.action in ('grade', 'pipeline'):
+        __install_solutions(assignments)
+    # Resolve the Elm packages once for all builds
+    if args.action == 'make':
+        from batch.make import prepare_package_store
+        prepare_package_store()
 
     # If args.repo is set, run once and exit
     if args.repo is not None:
-        ret = fn(args.repo, Context(args, None, None))
+        ctx = Context(args, None, None, assignments)
+        if args.action in ('pipeline', 'pull') and not args.force:
+            from batch.pull import check_heads
+            check_heads([args.repo], ctx)
+        if args.action in ASSIGNMENT_ACTIONS and args.action != 'pipeline':
+            fn = for_assignments(fn, ctx)
+        ret = fn(args.repo, ctx)
+        ctx.flush_rubrics()
+        if args.action == 'similarity':
+            from batch.similarity import index_signatures
+            index_signatures([ret])
         print(ret)
         exit()
 
     # Read CSV for repositories
-    summary = pd.read_csv(CLASS_SUMMARY)
+    with metrics.timed('csv read'):
+        summary = load_summary(args.action)
 
     # Context can be modified
-    ctx = Context(args, summary, ALIAS_POOL)
-    return_values = []
+    ctx = Context(args, summary, ALIAS_POOL, assignments)
+    if args.action == 'collect':
+        from batch.collect import reserve_aliases
+        reserve_aliases(ctx)
+    journal = Journal(args.action, args.resume, '+'.join(assignment.identifier for assignment in assignments))
+    changed = None
+    if args.changed:
+        from batch.pull import load_changed
+        changed = load_changed()
+    processed = []
+    repo_names = []
 
     for i, repo in enumerate(summary['Repo']):
         if len(repo) == 0:
@@ -67,34 +162,188 @@ def main():
         if i < args.skip:
             print('> Skipping', repo)
             continue
-        if type(args.limit) is int and i - args.skip >= args.limit:
+        if changed is not None and repo not in changed:
+            continue
+        if type(args.limit) is int and len(processed) >= args.limit:
             print('> Reached maximum number of repositories to process.')
             break
-        if fn is not pull and not os.path.isdir(os.path.join(REPOS_DIR, repo, HW_DIR)):
-            print("> Repository {0} does not have homework {1}, skipping".format(os.path.join(REPOS_DIR, repo, HW_DIR), HW_DIR))
-            return_values.append(-1)
+        processed.append(repo)
+        if args.resume and journal.status(repo) == DONE:
+            continue
+        if args.action not in ('pipeline', 'pull') and not has_homework(repo, ctx):
+            print("> Repository {0} does not have homework {1}, skipping".format(
+                os.path.join(REPOS_DIR, repo), ', '.join(assignment.hw_dir for assignment in assignments)))
+            journal.record(repo, DONE, -1)
             continue
+        journal.record(repo, PENDING)
+        repo_names.append(repo)
 
-        ret = fn(repo, ctx)
-        return_values.append(ret)
+    if changed is not None:
+        print("> {0} changed repositories".format(len(processed)))
+    if args.action in ('pipeline', 'pull') and not args.force:
+        from batch.pull import check_heads
+        check_heads(repo_names, ctx)
+    # Every repository is visited once, for all selected homeworks
+    if args.action in ASSIGNMENT_ACTIONS and args.action != 'pipeline':
+        fn = for_assignments(fn, ctx)
+    if args.resume:
+        print("> Resuming, {0} of {1} repositories left".format(len(repo_names), len(processed)))
 
-    print(return_values)
+    def on_done(repo_name, result, error, duration):
+        # A repository is only done once its queued rubric is on disk, so --resume never skips a lost one
+        ctx.flush_rubrics()
+        journal.on_done(repo_name, result, error, duration)
 
-    if args.limit is not None or args.skip > 0:
-        exit()
+    start = time.perf_counter()
+    try:
+        # Run the action; every repository's outcome is journaled as soon as it finishes
+        if args.action == 'pipeline':
+            from batch.pipeline import run_pipeline
+            run_pipeline(repo_names, ctx, stage_jobs, journal.on_start, on_done)
+        elif args.batch_size > 1:
+            map_repos(__load(BATCH_DISPATCH[args.action]), repo_names, ctx, args.jobs, PARALLEL_ACTIONS.get(args.action, False),
+                      journal.on_start, on_done, args.batch_size)
+        else:
+            map_repos(fn, repo_names, ctx, args.jobs, PARALLEL_ACTIONS.get(args.action, False),
+                      journal.on_start, on_done, sandboxes=args.action in SANDBOX_ACTIONS)
+    finally:
+        ctx.flush_rubrics()
+        __conclude(args, ctx, journal, processed, repo_names)
+        metrics.record('action', time.perf_counter() - start)
+        if run_id is not None:
+            __report_metrics(args, run_id)
+
+
+def __conclude(args, ctx, journal, processed, repo_names):
+    """
+    Merges the results of this and previous runs from the journal into the summary, and writes the CSV.
+    Runs even if the action was interrupted, so finished repositories are never lost.
+    """
+    done = [repo for repo in processed if journal.status(repo) == DONE]
+    return_values = [journal.result(repo) for repo in done]
+
+    if args.action in ('make', 'pull', 'push'):
+        from batch.svn import print_summary
+        statuses = [journal.result(repo) if journal.status(repo) == DONE else journal.status(repo)
+                    for repo in repo_names]
+        names = repo_names
+        if args.action == 'push' and len(ctx.assignments) > 1:
+            pairs = [("{0} {1}".format(repo, hw), status) for repo, ret in zip(repo_names, statuses)
+                     for hw, status in __by_assignment(ctx, ret).items()]
+            names, statuses = [name for name, _ in pairs], [status for _, status in pairs]
+        print_summary(names, statuses)
+    else:
+        print(return_values)
+
+    unfinished = [repo for repo in processed if journal.status(repo) != DONE]
+    if len(unfinished) > 0:
+        print("> {0} repositories did not finish, rerun with --resume: {1}".format(
+            len(unfinished), ' '.join(unfinished)))
 
     # Further actions
-    if args.action == 'grade':
-        summary[HW_DIR] = return_values
-        print(len(return_values))
-        print(float(sum(return_values)) / len(return_values))
-    elif args.action == 'late-chip':
-        summary[HW_DIR + '_late_chip'] = return_values
+    column = RESULT_COLUMNS.get(args.action, None)
+    if column is not None:
+        for repo, ret in zip(done, return_values):
+            # One transaction per repository, so other runs never see it half updated
+            with ctx.transaction():
+                if args.action in ASSIGNMENT_ACTIONS:
+                    for hw, hw_ret in __by_assignment(ctx, ret).items():
+                        ctx.set(repo, column.format(hw=hw), hw_ret)
+                else:
+                    ctx.set(repo, column.format(hw=HW_DIR), ret)
+    if args.action in ('grade', 'pipeline', 'rescore') and len(return_values) > 0:
+        for assignment in ctx.assignments:
+            scores = [__by_assignment(ctx, ret).get(assignment.hw_dir) for ret in return_values]
+            scores = [score for score in scores if score is not None]
+            if len(ctx.assignments) > 1:
+                print('>', assignment.hw_dir)
+            print(len(scores))
+            print(float(sum(scores)) / max(len(scores), 1))
+    elif args.action == 'pull':
+        from batch.pull import save_changed
+        save_changed(done, return_values)
     elif args.action == 'collect':
-        summary[HW_DIR + '_alias'] = return_values
+        from batch.collect import report_duplicates
+        report_duplicates([ret for ret in return_values if isinstance(ret, str)])
+    elif args.action == 'similarity':
+        from batch.similarity import report_similar
+        report_similar([ret for ret in return_values if isinstance(ret, dict)])
+    elif args.action == 'collect-votes':
+        if len(unfinished) > 0:
+            print('> Not tallying votes until all ballots are read')
+        else:
+            from batch.collect_votes import tally_votes
+            tally_votes(ctx, done, return_values)
+
+    # Write CSV, unless the gradebook already has every change
+    with metrics.timed('csv write'):
+        save_summary(ctx.summary)
+
+
+def __load(path):
+    """
+    Imports the function of an action.
+    :param path: string, module.function
+    :return: function
+    """
+    module, _, name = path.rpartition('.')
+    return getattr(importlib.import_module(module), name)
+
+
+def __by_assignment(ctx, ret):
+    """
+    :param ret: return value of an action, a dict of them per homework if several were selected
+    :return: dict, homework directory -> return value
+    """
+    if isinstance(ret, dict):
+        return ret
+    return {assignment.hw_dir: ret for assignment in ctx.assignments}
+
+
+def __install_solutions(assignments):
+    """
+    Copies the solutions of every selected homework into the elm-tester, which they share.
+    """
+    installed = {}
+    for assignment in assignments:
+        for solution in assignment.solutions:
+            solution_hash = file_digest(os.path.join(assignment.tests_path, 'solution', solution))
+            if installed.get(solution, solution_hash) != solution_hash:
+                raise RuntimeError("> Homeworks {0} have different solutions named {1}, grade them separately".format(
+                    ', '.join(a.hw_dir for a in assignments), solution))
+            installed[solution] = solution_hash
+        install_solutions(ELM_TESTER_DIR, assignment)
+
+
+def __parse_stage_jobs(text):
+    """
+    :param text: string, e.g. 'pull=8,grade=4', or None
+    :return: dict, stage name -> number of workers
+    """
+    from batch.pipeline import STAGES
+    stage_jobs = {}
+    for item in (text or '').split(','):
+        if len(item.strip()) == 0:
+            continue
+        stage, _, jobs = item.partition('=')
+        if stage.strip() not in STAGES or not jobs.strip().isdigit() or int(jobs) < 1:
+            raise RuntimeError("> Bad stage jobs '{0}', expected STAGE=N with STAGE one of {1}".format(
+                item, ', '.join(STAGES)))
+        stage_jobs[stage.strip()] = int(jobs)
+    return stage_jobs
+
 
-    # Write CSV
-    summary.to_csv(CLASS_SUMMARY, index=False)
+def __report_metrics(args, run_id):
+    """
+    Prints the timing summary of this run, and exports it if a CSV file was asked for.
+    """
+    if args.metrics.endswith('.csv'):
+        entries = metrics.load_run(run_id, METRICS_PATH)
+        metrics.export_csv(entries, args.metrics)
+    else:
+        entries = metrics.load_run(run_id, args.metrics)
+    metrics.summarize(entries)
+    print('> Timings saved to', args.metrics)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+import json
+from .constants import *
+
+NO_HOMEWORK = -1
+
+
+class Assignment(object):
+    """A homework: where it lives in the repositories, which files make it up, and when it is due."""
+    def __init__(self, hw_dir, files, solutions, deadline):
+        """
+        :param hw_dir: string, directory of the homework in each repository and in TESTS_DIR
+        :param files: list of strings, the modules students submit
+        :param solutions: list of strings, the modules of the solution the tests also need
+        :param deadline: timezone-aware datetime
+        """
+        super(Assignment, self).__init__()
+        self.hw_dir = hw_dir
+        self.identifier = hw_dir.replace('/', '.')
+        self.files = files
+        self.solutions = solutions
+        self.deadline = deadline
+        self.rubric_filename = "{0}.rubric.txt".format(hw_dir)
+        self.tests_path = os.path.join(TESTS_DIR, hw_dir)
+        self.event_logs_dir = os.path.join(BASE_DIR, 'logs', self.identifier)
+
+    def hw_path(self, repo_name):
+        """
+        :param repo_name: string
+        :return: string, the homework directory in a repository
+        """
+        return os.path.join(REPOS_DIR, repo_name, self.hw_dir)
+
+
+DEFAULT_ASSIGNMENT = Assignment(HW_DIR, HW_FILES, SOLUTION_FILES, DEADLINE)
+
+
+def load_assignments(path=ASSIGNMENTS_PATH):
+    """
+    Reads the assignments config, a JSON object of homework directory -> files, solutions and deadline,
+    given as 'YYYY-MM-DD HH:MM:SS' in TIMEZONE.
+    The homework of HW_DIR, HW_FILES, SOLUTION_FILES and DEADLINE is used if the config does not list it.
+    :param path: string
+    :return: dict, homework directory -> Assignment
+    """
+    assignments = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            config = json.load(f)
+        for hw_dir, entry in config.items():
+            deadline = datetime.fromisoformat(entry['deadline']).replace(tzinfo=TIMEZONE)
+            assignments[hw_dir] = Assignment(hw_dir, entry['files'], entry.get('solutions', []), deadline)
+    assignments.setdefault(HW_DIR, DEFAULT_ASSIGNMENT)
+    return assignments
+
+
+def select_assignments(names, path=ASSIGNMENTS_PATH):
+    """
+    :param names: string, comma-separated homework directories, or None for HW_DIR
+    :param path: string, the assignments config
+    :return: list of Assignments
+    """
+    assignments = load_assignments(path)
+    selected = []
+    for name in (names or HW_DIR).split(','):
+        name = name.strip()
+        if name not in assignments:
+            raise RuntimeError("> Unknown homework '{0}', expected one of {1} (see {2})".format(
+                name, ', '.join(assignments), path))
+        if assignments[name] not in selected:
+            selected.append(assignments[name])
+    return selected
+
+
+class EachAssignment(object):
+    """
+    Runs an action once for each selected assignment in one visit of a repository.
+    A class rather than a closure, so it can be sent to worker processes.
+    """
+    def __init__(self, fn):
+        """
+        :param fn: function(repo_name, ctx), the action to run
+        """
+        super(EachAssignment, self).__init__()
+        self.fn = fn
+
+    def __call__(self, repo_name, ctx):
+        """
+        :param repo_name: string
+        :param ctx: Context, whose assignments are run in order
+        :return: dict, homework directory -> return value; NO_HOMEWORK if the repository does not have it
+        """
+        results = {}
+        for assignment in ctx.assignments:
+            if not os.path.isdir(assignment.hw_path(repo_name)):
+                print("> Repository {0} does not have homework {1}, skipping".format(repo_name, assignment.hw_dir))
+                results[assignment.hw_dir] = NO_HOMEWORK
+                continue
+            results[assignment.hw_dir] = self.fn(repo_name, ctx.with_assignment(assignment))
+        return results
+
+
+def for_assignments(fn, ctx):
+    """
+    :param fn: function(repo_name, ctx), an action
+    :param ctx: Context
+    :return: the action, run for each assignment if several are selected
+    """
+    return EachAssignment(fn) if len(ctx.assignments) > 1 else fn
+
+
+def has_homework(repo_name, ctx):
+    """
+    :param repo_name: string
+    :param ctx: Context
+    :return: bool, whether the repository has the directory of any selected assignment
+    """
+    return any(os.path.isdir(assignment.hw_path(repo_name)) for assignment in ctx.assignments)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+import json
+import re
+import shutil
+import tempfile
+from .constants import *
+from .digest import digest
+
+ELM_VERSION = '0.18.0'
+ELM_ARTIFACTS_SUBPATH = os.path.join('elm-stuff', 'build-artifacts', ELM_VERSION)
+ARTIFACT_EXTENSIONS = ['.elmi', '.elmo']
+IMPORT_PATTERN = re.compile(r'^import\s+([A-Z][\w.]*)', re.MULTILINE)
+
+
+def artifacts_dir(project_dir):
+    """
+    Finds the directory where elm-make puts the compiled modules of an Elm project.
+    :param project_dir: string, directory containing elm-package.json
+    :return: string
+    """
+    with open(os.path.join(project_dir, 'elm-package.json')) as f:
+        package = json.load(f)
+    repository = package['repository']
+    if repository.endswith('.git'):
+        repository = repository[:-4]
+    user, project = repository.rstrip('/').split('/')[-2:]
+    return os.path.join(project_dir, ELM_ARTIFACTS_SUBPATH, user, project, package['version'])
+
+
+def find_modules(source_dir):
+    """
+    Lists the Elm modules in a source directory.
+    :param source_dir: string
+    :return: dict, module name -> file path
+    """
+    modules = {}
+    for root, dirs, files in os.walk(source_dir):
+        dirs[:] = [d for d in dirs if d != 'elm-stuff']
+        for file in files:
+            if file.endswith('.elm'):
+                path = os.path.join(root, file)
+                module = os.path.relpath(path, source_dir)[:-4].replace(os.sep, '.')
+                modules[module] = path
+    return modules
+
+
+class BuildCache(object):
+    """
+    Content-addressed store of compiled Elm modules.
+
+    A module's key is the hash of its source together with the keys of the local modules it imports,
+    so a module is only recompiled when it, or something it depends on, has changed.
+    """
+    def __init__(self, cache_dir):
+        """
+        :param cache_dir: string, where the compiled modules are stored
+        """
+        super(BuildCache, self).__init__()
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self.__missed = {}
+
+    def __module_keys(self, modules):
+        keys = {}
+        sources = {}
+        for module, path in modules.items():
+            with open(path, 'rb') as f:
+                sources[module] = f.read()
+
+        def key_of(module, visiting):
+            if module in keys:
+                return keys[module]
+            visiting.add(module)
+            source = sources[module]
+            imports = sorted(set(IMPORT_PATTERN.findall(source.decode('utf-8', 'replace'))))
+            parts = [ELM_VERSION, module, source]
+            for imported in imports:
+                if imported in sources and imported not in visiting:
+                    parts += [imported, key_of(imported, visiting)]
+            visiting.discard(module)
+            keys[module] = digest(*parts)
+            return keys[module]
+
+        for module in modules:
+            key_of(module, set())
+        return keys
+
+    def restore(self, project_dir, source_dir):
+        """
+        Puts cached artifacts in place for unchanged modules and removes the stale artifacts of changed ones.
+        Must be called after the sources are in place, so that restored artifacts are newer than their sources.
+        :param project_dir: string, directory containing elm-package.json
+        :param source_dir: string, directory containing the Elm modules
+        :return: None
+        """
+        target_dir = artifacts_dir(project_dir)
+        os.makedirs(target_dir, exist_ok=True)
+        keys = self.__module_keys(find_modules(source_dir))
+        for module, key in keys.items():
+            artifact_name = module.replace('.', '-')
+            cached = [os.path.join(self.cache_dir, key + ext) for ext in ARTIFACT_EXTENSIONS]
+            targets = [os.path.join(target_dir, artifact_name + ext) for ext in ARTIFACT_EXTENSIONS]
+            if all(os.path.exists(path) for path in cached):
+                self.hits += 1
+                for src, dst in zip(cached, targets):
+                    shutil.copyfile(src, dst)
+            else:
+                self.misses += 1
+                self.__missed[module] = key
+                for dst in targets:
+                    if os.path.exists(dst):
+                        os.remove(dst)
+
+    def store(self, project_dir):
+        """
+        Saves the freshly compiled artifacts of the modules that missed the cache.
+        :param project_dir: string, directory containing elm-package.json
+        :return: None
+        """
+        source_dir = artifacts_dir(project_dir)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for module, key in self.__missed.items():
+            artifact_name = module.replace('.', '-')
+            sources = [os.path.join(source_dir, artifact_name + ext) for ext in ARTIFACT_EXTENSIONS]
+            if not all(os.path.exists(path) for path in sources):
+                continue  # did not compile
+            for src, ext in zip(sources, ARTIFACT_EXTENSIONS):
+                # Write to a temporary file first, so concurrent graders never see a partial artifact
+                fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir)
+                os.close(fd)
+                shutil.copyfile(src, tmp_path)
+                os.replace(tmp_path, os.path.join(self.cache_dir, key + ext))
+        self.__missed = {}
@@ -3,33 +3,133 @@
 from glob import glob
 import random
 import shutil
+import tempfile
+import threading
 from .constants import *
+from .digest import file_digest
 
 REQUIRED_FILES = ['Pi.html', 'ThumbPi.*']
 DESTINATION_PATH = os.path.join(BASE_DIR, 'submissions')
+# Content-addressed copies of all collected files; the alias directories hold hard links to them
+OBJECTS_PATH = os.path.join(DESTINATION_PATH, '.objects')
+ALIAS_COLUMN = HW_DIR + '_alias'
+
+_alias_lock = threading.Lock()
+
+
+def __alias_of(repo_name, ctx):
+    """
+    :return: string, the alias given to a repository in an earlier run, or None
+    """
+    alias = ctx.get(repo_name, ALIAS_COLUMN)
+    if alias is None:
+        return None
+    return str(int(alias)) if isinstance(alias, float) else str(alias)  # pandas reads aliases as numbers
+
+
+def reserve_aliases(ctx):
+    """
+    Takes the aliases already given out in the class summary out of the pool, so collecting again reuses them.
+    :param ctx: Context
+    :return: None
+    """
+    taken = set(__alias_of(repo_name, ctx) for repo_name in ctx.rows)
+    ctx.alias_pool[:] = [alias for alias in ctx.alias_pool if alias not in taken]
+
+
+def __assign_alias(repo_name, ctx):
+    alias = __alias_of(repo_name, ctx)
+    if alias is not None:
+        return alias
+    with _alias_lock:
+        return ctx.alias_pool.pop(random.randint(0, len(ctx.alias_pool) - 1))
+
+
+def __store(path):
+    """
+    Puts a file in the content-addressed store.
+    :param path: string
+    :return: string, path of the stored copy
+    """
+    object_path = os.path.join(OBJECTS_PATH, file_digest(path))
+    if not os.path.exists(object_path):
+        os.makedirs(OBJECTS_PATH, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=OBJECTS_PATH)
+        os.close(fd)
+        shutil.copyfile(path, tmp_path)
+        shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, object_path)
+    return object_path
+
+
+def __link(object_path, path):
+    """
+    Makes path a hard link to a stored file, unless it already is one.
+    :return: bool, whether path changed
+    """
+    if os.path.exists(path) and os.path.samefile(object_path, path):
+        return False
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    os.close(fd)
+    os.remove(tmp_path)
+    try:
+        os.link(object_path, tmp_path)
+    except OSError:
+        shutil.copyfile(object_path, tmp_path)
+    os.replace(tmp_path, path)
+    return True
 
 
 def collect(repo_name, ctx):
     """
-    Collect OUTPUT_FILE from a repository and assign an alias to it
+    Collect OUTPUT_FILE from a repository and assign an alias to it.
+    Files are only stored once however many students submitted them, and unchanged files are left alone.
     :param repo_name: string
     :param ctx: Context
     :return: string, the assigned alias
     """
-    idx = random.randint(0, len(ctx.alias_pool) - 1)
-    alias = ctx.alias_pool.pop(idx)
+    alias = __assign_alias(repo_name, ctx)
     print('> Collecting', repo_name, "(alias: {})".format(alias))
     hw_path = os.path.join(REPOS_DIR, repo_name, HW_DIR)
     dest_path = os.path.join(DESTINATION_PATH, alias)
-    if os.path.exists(dest_path):
-        print('> Warning: ', dest_path, 'already exists. Abort.')
-        return alias
-    else:
-        os.makedirs(dest_path)
+    os.makedirs(dest_path, exist_ok=True)
 
-    # Copy the required files
+    # Link the required files
+    collected = set()
+    n_changed = 0
     for regex in REQUIRED_FILES:
         for file in glob(os.path.join(hw_path, regex)):
-            shutil.copy(file, dest_path)
+            filename = os.path.basename(file)
+            collected.add(filename)
+            if __link(__store(file), os.path.join(dest_path, filename)):
+                n_changed += 1
 
+    # Drop files the student no longer submits
+    for filename in os.listdir(dest_path):
+        if filename not in collected:
+            os.remove(os.path.join(dest_path, filename))
+            n_changed += 1
+    if n_changed == 0:
+        print('> Unchanged', alias)
     return alias
+
+
+def report_duplicates(aliases):
+    """
+    Prints the files that several aliases submitted with identical content.
+    :param aliases: list of strings
+    :return: list of lists of strings, the aliases sharing some file
+    """
+    owners = {}
+    for alias in aliases:
+        dest_path = os.path.join(DESTINATION_PATH, alias)
+        if not os.path.isdir(dest_path):
+            continue
+        for filename in os.listdir(dest_path):
+            st = os.stat(os.path.join(dest_path, filename))
+            owners.setdefault((filename, st.st_dev, st.st_ino), []).append(alias)
+    duplicates = [(filename, sorted(set(group))) for (filename, _, _), group in sorted(owners.items())
+                  if len(set(group)) > 1]
+    for filename, group in duplicates:
+        print("> Identical {0} submitted by aliases {1}".format(filename, ', '.join(group)))
+    return [group for _, group in duplicates]
@@ -1,57 +1,92 @@
 #!/usr/bin/env python3
 
-import math
+import pandas as pd
 from .constants import *
 
 VOTING_FILE_PATH = os.path.join('voting', 'hw2-votes.txt')
 ALT_VOTING_FILE_PATH = 'hw2-votes.txt'
 VOTES_COLUMN = 'hw2_votes'
-
-
-def __find_original(summary, alias):
-    """
-    Finds the original repository given an alias.
-    :param summary: CSV
-    :param alias: int
-    :return: int, the index to the original repository
-    """
-    for idx, a in enumerate(summary['hw2_alias']):
-        if not math.isnan(a) and int(a) == alias:  # an alias is an integer
-            return idx
-    return None
+ALIAS_COLUMN = 'hw2_alias'
+MAX_VOTES = 10  # the first vote weighs MAX_VOTES, the last one 1
 
 
 def collect_votes(repo_name, ctx):
     """
-    Collect the votes from a repository and update the Context
+    Reads the votes of a repository; they are counted by tally_votes once all repositories are read.
     :param repo_name: string
     :param ctx: Context
-    :return: none (side effect)
+    :return: list of strings, the votes in order of preference; None if there is no voting file
     """
     print('> Processing', repo_name, VOTES_COLUMN)
     repo_path = os.path.join(REPOS_DIR, repo_name)
-    try:
-        f = open(os.path.join(repo_path, VOTING_FILE_PATH))
-    except FileNotFoundError:
+    for path in [VOTING_FILE_PATH, ALT_VOTING_FILE_PATH]:
         try:
-            f = open(os.path.join(repo_path, ALT_VOTING_FILE_PATH))
+            with open(os.path.join(repo_path, path)) as f:
+                return [line.strip() for line in f.readlines() if len(line.strip()) > 0]
         except FileNotFoundError:
-            print('Voting file not found, skip')
-            return
-    vote_items = [line.rstrip() for line in f.readlines()]
-    weight = 10
-    for alias in vote_items:
-        try:
-            idx = __find_original(ctx.summary, int(alias))
-        except ValueError:
-            print('value error', alias)
             continue
-        if idx is None:
-            print('Error: invalid vote for', alias)
-        else:
-            if math.isnan(ctx.summary.get_value(idx, VOTES_COLUMN)):
-                ctx.summary.set_value(idx, VOTES_COLUMN, 0)
-            ctx.summary.set_value(idx, VOTES_COLUMN, ctx.summary.get_value(idx, VOTES_COLUMN) + weight)
-        weight -= 1
-        if weight == 0:
-            break
+    print('Voting file not found, skip')
+    return None
+
+
+def __ballot_rows(repo_names, ballots):
+    """
+    Flattens ballots into (voter, vote, alias, weight) rows.
+    Votes that are not numbers get no alias and do not use up a weight.
+    """
+    rows = []
+    for repo_name, ballot in zip(repo_names, ballots):
+        weight = MAX_VOTES
+        for vote in ballot or []:
+            if weight == 0:
+                break
+            try:
+                alias = int(vote)
+            except ValueError:
+                rows.append((repo_name, vote, None, 0))
+                continue
+            rows.append((repo_name, vote, alias, weight))
+            weight -= 1
+    return pd.DataFrame(rows, columns=['Voter', 'Vote', 'Alias', 'Weight'])
+
+
+def tally_votes(ctx, repo_names, ballots):
+    """
+    Sets VOTES_COLUMN to the weighted votes of the given ballots and prints the votes that were not counted.
+    The column is rebuilt from the ballots every time, so running again or resuming never counts a ballot twice.
+    :param ctx: Context
+    :param repo_names: list of strings, the voters
+    :param ballots: list, return values of collect_votes for each voter
+    :return: pandas DataFrame, the votes that were not counted and why
+    """
+    summary = ctx.summary
+    votes = __ballot_rows(repo_names, ballots)
+
+    # alias -> row in summary, and voter -> own alias
+    aliases = pd.Series(summary[ALIAS_COLUMN], index=summary.index).dropna().astype(int)
+    alias_rows = pd.Series(aliases.index, index=aliases.values)
+    own_aliases = {repo_name: ctx.get_int(repo_name, ALIAS_COLUMN) for repo_name in repo_names}
+
+    votes['Row'] = votes['Alias'].map(alias_rows)
+    votes['Problem'] = None
+    votes.loc[votes.duplicated(['Voter', 'Alias']), 'Problem'] = 'duplicate vote'
+    votes.loc[votes['Alias'] == votes['Voter'].map(own_aliases), 'Problem'] = 'self-vote'
+    votes.loc[votes['Row'].isna(), 'Problem'] = 'invalid alias'
+    votes.loc[votes['Alias'].isna(), 'Problem'] = 'not a number'
+
+    # Sum the weights per submission in one go
+    counted = votes[votes['Problem'].isna()]
+    totals = counted.groupby('Row')['Weight'].sum()
+    # Only the votes column is written, one repository at a time, so concurrent runs keep their changes
+    totals = dict(totals.items())
+    for repo_name, row in ctx.rows.items():
+        total = float(totals[row]) if row in totals else None
+        if ctx.get_float(repo_name, VOTES_COLUMN) != total:
+            with ctx.transaction():
+                ctx.set(repo_name, VOTES_COLUMN, total)
+
+    rejected = votes[votes['Problem'].notna()][['Voter', 'Vote', 'Problem']]
+    print("> Counted {0} votes, rejected {1}".format(len(counted), len(rejected)))
+    if len(rejected) > 0:
+        print(rejected.to_string(index=False))
+    return rejected
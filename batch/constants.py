@@ -3,22 +3,51 @@
 import os
 from datetime import datetime
 import math
+from zoneinfo import ZoneInfo
 from .context import Context
 
-BASE_DIR = '/Users/luans/cs22300/'
+# Both can be overridden from the environment, e.g. to run against the synthetic class of bench/
+BASE_DIR = os.environ.get('GRADER_BASE_DIR', '/Users/luans/cs22300/')
 HW_DIR = 'hw5'
 HW_IDENTIFIER = HW_DIR.replace('/', '.')
+SEMESTER = 'spr-17'
 HW_FILES = ['RBMaps.elm', 'RBTreesDel.elm', 'RBTrees1.elm', 'RBTrees2.elm', 'RBTrees3.elm']
 SOLUTION_FILES = ['RedBlackTree.elm']
 FILES_DIR = os.path.join(BASE_DIR, 'grader', 'files')
+# Homework directory -> files, solutions and deadline of every assignment, for --hw
+ASSIGNMENTS_PATH = os.path.join(BASE_DIR, 'grader', 'assignments.json')
 REPOS_DIR = os.path.join(BASE_DIR, 'repositories/')
 TESTS_DIR = os.path.join(BASE_DIR, 'cs22300-sp17/tests/')
 CLASS_SUMMARY = os.path.join(BASE_DIR, 'cs223-spr-17-admin', 'class_summary.csv')
-ELM_TESTER_DIR = './elm-tester'
+# The class summary as a database; used instead of CLASS_SUMMARY once it exists, see batch.gradebook
+GRADEBOOK_PATH = os.path.join(BASE_DIR, 'cs223-spr-17-admin', 'gradebook.sqlite')
+ELM_TESTER_DIR = os.environ.get('GRADER_ELM_TESTER_DIR', './elm-tester')
 TEMPLATE_FILENAME = 'report_template.txt'
 TESTS_FILENAME = 'Tests.elm'
+CACHE_DIR = os.path.join(BASE_DIR, 'cache')
+BUILD_CACHE_DIR = os.path.join(CACHE_DIR, 'elm-build')
+PACKAGE_STORE_DIR = os.path.join(CACHE_DIR, 'elm-packages')
+EVENT_LOGS_DIR = os.path.join(BASE_DIR, 'logs', HW_IDENTIFIER)
+METRICS_PATH = os.path.join(CACHE_DIR, 'metrics.jsonl')
+# Kept across homeworks and semesters, unlike the caches
+SIMILARITY_INDEX = os.path.join(BASE_DIR, 'similarity', 'index.sqlite')
+SIMILARITY_THRESHOLD = 0.7
+SVN_URL_PREFIX = 'https://phoenixforge.cs.uchicago.edu/svn/'
+SVN_RETRIES = 3
+SVN_BACKOFF = 2.0  # seconds before the first retry, doubled after each failure
+SVN_INFO_CHUNK = 100  # repository URLs per bulk `svn info` call
+# Revision each working copy was last updated to, kept across homeworks
+SVN_REVISIONS_PATH = os.path.join(CACHE_DIR, 'svn-revisions.json')
+# Repositories the last pull found new revisions in, one per line
+CHANGED_REPOS_PATH = os.path.join(CACHE_DIR, 'changed-repos.txt')
+DAEMON_SOCKET = os.path.join(CACHE_DIR, 'grader.sock')
+DAEMON_WORKERS = 4
+TEST_TIMEOUT = 300  # wall-clock seconds per submission
+TEST_CPU_LIMIT = None  # CPU seconds per submission
+TEST_MEMORY_LIMIT = None  # megabytes per submission
 RUBRIC_FILENAME = "{0}.rubric.txt".format(HW_DIR)
-DEADLINE = datetime.strptime('2017-04-24 12:00:00', '%Y-%m-%d %H:%M:%S')
+TIMEZONE = ZoneInfo('America/Chicago')
+DEADLINE = datetime(2017, 4, 24, 12, 0, 0, tzinfo=TIMEZONE)
 
 
 ALIAS_POOL = ['10301', '10501', '10601', '11311', '11411', '12421', '12721', '12821', '13331', '13831', '13931', '14341', '14741', '15451', '15551', '16061', '16361', '16561', '16661', '17471', '17971', '18181', '18481', '19391', '19891', '19991', '30103', '30203', '30403', '30703', '30803', '31013', '31513', '32323', '32423', '33533', '34543', '34843', '35053', '35153', '35353', '35753', '36263', '36563', '37273', '37573', '38083', '38183', '38783', '39293', '70207', '70507', '70607', '71317', '71917', '72227', '72727', '73037', '73237', '73637', '74047', '74747', '75557', '76367', '76667', '77377', '77477', '77977', '78487', '78787', '78887', '79397', '79697', '79997', '90709', '91019', '93139', '93239', '93739', '94049', '94349', '94649', '94849', '94949', '95959', '96269', '96469', '96769', '97379', '97579', '97879', '98389', '98689']
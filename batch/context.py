@@ -1,16 +1,125 @@
 #!/usr/bin/env python3
 
+import contextlib
+import copy
+
 
 class Context(object):
     """Context for operations on an individual repository."""
-    def __init__(self, args, summary, alias_pool):
+    def __init__(self, args, summary, alias_pool, assignments=None):
         """
         :param args: return value from argparse
-        :param summary: pandas CSV object
+        :param summary: pandas DataFrame, CsvSummary or Gradebook
         :param alias_pool: list
+        :param assignments: list of Assignments to process; None for the one of HW_DIR
         """
         super(Context, self).__init__()
         self.args = args
         self.summary = summary
         self.alias_pool = alias_pool
+        if assignments is None:
+            from .assignment import DEFAULT_ASSIGNMENT  # not at the top, as constants imports this module
+            assignments = [DEFAULT_ASSIGNMENT]
+        self.assignments = assignments
+        # The assignment actions work on
+        self.assignment = assignments[0]
+        # Repository name -> latest revision on the server, if pull checked; see pull.check_heads
+        self.head_revisions = None
+        # elm-tester project to grade in; None means the shared ELM_TESTER_DIR
+        self.tester_dir = None
+        # Repository name -> row label in summary
+        self.rows = {} if summary is None else dict(zip(summary['Repo'], summary.index))
+        # Rubric path -> text, written out by flush_rubrics
+        self.rubrics = {}
+
+    def with_assignment(self, assignment):
+        """
+        :param assignment: Assignment
+        :return: Context, a copy sharing everything but the assignment
+        """
+        ctx = copy.copy(self)
+        ctx.assignment = assignment
+        return ctx
+
+    def transaction(self):
+        """
+        Groups cell updates, so the gradebook writes them at once; CSV summaries are written as a whole anyway.
+        :return: context manager
+        """
+        transaction = getattr(self.summary, 'transaction', None)
+        return contextlib.nullcontext() if transaction is None else transaction()
 
+    def get(self, repo_name, column, default=None):
+        """
+        Reads a cell of the class summary.
+        :param repo_name: string
+        :param column: string
+        :param default: returned if the column does not exist or the cell is empty
+        :return: the cell value
+        """
+        if column not in self.summary:
+            return default
+        value = self.summary.at[self.rows[repo_name], column]
+        if value is None or value != value:  # NaN is not equal to itself
+            return default
+        return value
+
+    def get_str(self, repo_name, column):
+        """
+        :return: string, or None if the cell is empty
+        """
+        value = self.get(repo_name, column)
+        return None if value is None else str(value)
+
+    def get_float(self, repo_name, column):
+        """
+        :return: float, or None if the cell is empty
+        """
+        value = self.get(repo_name, column)
+        return None if value is None else float(value)
+
+    def get_int(self, repo_name, column):
+        """
+        :return: int, or None if the cell is empty
+        """
+        value = self.get(repo_name, column)
+        return None if value is None else int(value)
+
+    def set(self, repo_name, column, value):
+        """
+        Updates a cell of the class summary, creating the column if needed.
+        :param repo_name: string
+        :param column: string
+        :param value: new cell value
+        :return: None
+        """
+        if column not in self.summary:
+            self.summary[column] = None
+        row = self.rows[repo_name]
+        try:
+            self.summary.at[row, column] = value
+        except (TypeError, ValueError):
+            # The value does not fit the column's type, e.g. a string in a numeric column
+            self.summary[column] = self.summary[column].astype(object)
+            self.summary.at[row, column] = value
+
+    def write_rubric(self, rubric_path, text):
+        """
+        Queues a rubric file to be written by flush_rubrics.
+        :param rubric_path: string
+        :param text: string
+        :return: None
+        """
+        self.rubrics[rubric_path] = text
+
+    def flush_rubrics(self):
+        """
+        Writes all queued rubric files.
+        :return: int, number of files written
+        """
+        for rubric_path, text in self.rubrics.items():
+            with open(rubric_path, 'w') as f:
+                f.write(text)
+        count = len(self.rubrics)
+        self.rubrics = {}
+        return count
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+import argparse
+import errno
+import json
+import queue
+import signal
+import socket
+import socketserver
+import subprocess
+import tempfile
+from .build_cache import BuildCache
+from .constants import *
+from .digest import digest, file_digest
+from .sandbox import create_sandbox, install_solutions
+
+# Arguments that are paths, made absolute by the client since the daemon runs elsewhere
+PATH_ARGUMENTS = ['test_dir', 'output', 'log', 'build_cache']
+# The test runner of tests/Main.elm without the tests, so its packages compile before any submission is staged
+HARNESS_MODULE = 'WarmUpHarness'
+HARNESS_TEMPLATE = '''port module {module} exposing (..)
+
+import Test exposing (describe)
+import Test.Runner.Node exposing (run, TestProgram)
+import Json.Encode exposing (Value)
+
+
+main : TestProgram
+main =
+    run emit (describe "{module}" [])
+
+
+port emit : ( String, Value ) -> Cmd msg
+'''
+
+
+def __raise_error(response):
+    """
+    Re-raises an error that happened in the daemon, as the same exception type.
+    :param response: dict
+    :return: None
+    """
+    import grader
+    error, message = response['error'], response['message']
+    if error == 'FileNotFoundError':
+        raise FileNotFoundError(errno.ENOENT, message, response['filename'])
+    for exception in [grader.BrokenTestsError, grader.TestingFailureError, grader.TestingTimeoutError]:
+        if error == exception.__name__:
+            raise exception(message)
+    raise RuntimeError("Grading daemon failed: {0}: {1}".format(error, message))
+
+
+def request_grade(args, socket_path=DAEMON_SOCKET):
+    """
+    Asks a running grading daemon to grade a submission.
+    :param args: parsed grader command line arguments
+    :param socket_path: string
+    :return: (string, int), (report text, points); None if no daemon is running
+    """
+    if not os.path.exists(socket_path):
+        return None
+    request = dict(vars(args))
+    for name in PATH_ARGUMENTS:
+        if request[name] is not None:
+            request[name] = os.path.abspath(request[name])
+    if request['dependencies'] is not None:
+        request['dependencies'] = [os.path.abspath(path) for path in request['dependencies']]
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+            sock.sendall((json.dumps(request) + '\n').encode('utf-8'))
+            with sock.makefile('rb') as f:
+                response = json.loads(f.readline().decode('utf-8'))
+    except (ConnectionRefusedError, FileNotFoundError):
+        return None  # stale socket of a daemon that is gone
+    if args.verbose:
+        print('Graded by daemon.')
+    if 'error' in response:
+        __raise_error(response)
+    return response['report'], response['score']
+
+
+def solutions_digest():
+    """
+    Hashes the solution modules of HW_DIR, to tell when the ones in a workspace are out of date.
+    :return: string, hex digest
+    """
+    parts = []
+    for solution in SOLUTION_FILES:
+        parts += [solution, file_digest(os.path.join(TESTS_DIR, HW_DIR, 'solution', solution))]
+    return digest(*parts)
+
+
+def warm_up(tester_dir):
+    """
+    Prepares an elm-tester workspace: installs the solutions and compiles them with the packages and
+    the test runner harness, so a grade only compiles the student's modules and the tests.
+    :param tester_dir: string
+    :return: string, digest of the installed solutions
+    """
+    tests_dir = os.path.join(tester_dir, 'tests')
+    installed = solutions_digest()
+    install_solutions(tester_dir)
+    build_cache = BuildCache(BUILD_CACHE_DIR)
+    build_cache.restore(tests_dir, tests_dir)
+    harness_path = os.path.join(tests_dir, HARNESS_MODULE + '.elm')
+    with open(harness_path, 'w') as f:
+        f.write(HARNESS_TEMPLATE.format(module=HARNESS_MODULE))
+    try:
+        subprocess.run(['elm-make', '--yes'] + SOLUTION_FILES + [HARNESS_MODULE + '.elm', '--output', '/dev/null'],
+                       cwd=tests_dir, stdout=subprocess.DEVNULL)
+    finally:
+        os.remove(harness_path)
+    build_cache.store(tests_dir)
+    return installed
+
+
+class GradeHandler(socketserver.StreamRequestHandler):
+    """Grades one submission per connection in a free workspace."""
+    def handle(self):
+        import grader
+        request = json.loads(self.rfile.readline().decode('utf-8'))
+        tester_dir = self.server.workspaces.get()
+        try:
+            # Solutions fixed since the workspace was prepared are installed before grading with them
+            if self.server.solutions[tester_dir] != solutions_digest():
+                print('> Solutions changed, preparing workspace', tester_dir, 'again')
+                self.server.solutions[tester_dir] = warm_up(tester_dir)
+            request['tester_dir'] = tester_dir
+            report, score = grader.grade_locally(argparse.Namespace(**request))
+            response = {'report': report, 'score': score}
+        except Exception as e:
+            # Sent back so the client can raise the same error
+            response = {'error': type(e).__name__, 'message': str(e), 'filename': getattr(e, 'filename', None)}
+        finally:
+            self.server.workspaces.put(tester_dir)
+        self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+
+
+class GradingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server holding a pool of warm elm-tester workspaces."""
+    daemon_threads = True
+
+    def __init__(self, socket_path, tester_dirs):
+        """
+        :param socket_path: string
+        :param tester_dirs: dict, prepared elm-tester workspace -> digest of the solutions installed in it
+        """
+        self.workspaces = queue.Queue()
+        self.solutions = dict(tester_dirs)
+        for tester_dir in tester_dirs:
+            self.workspaces.put(tester_dir)
+        super(GradingServer, self).__init__(socket_path, GradeHandler)
+
+
+def __interrupt(signum, frame):
+    raise KeyboardInterrupt()
+
+
+def serve(socket_path=DAEMON_SOCKET, workers=DAEMON_WORKERS):
+    """
+    Runs the grading daemon until interrupted.
+    :param socket_path: string
+    :param workers: int, number of workspaces, i.e. grades that can run at once
+    :return: None
+    """
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    # Shut down cleanly on kill too, so no stale socket is left behind
+    signal.signal(signal.SIGTERM, __interrupt)
+    os.makedirs(os.path.dirname(os.path.abspath(socket_path)), exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix='grader-daemon-') as sandbox_root:
+        tester_dirs = {}
+        for i in range(workers):
+            print("> Preparing workspace {0} of {1}".format(i + 1, workers))
+            tester_dir = create_sandbox(sandbox_root)
+            tester_dirs[tester_dir] = warm_up(tester_dir)
+        server = GradingServer(socket_path, tester_dirs)
+        try:
+            print('> Grading daemon listening on', socket_path)
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            os.remove(socket_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Keep warm elm-tester workspaces and grade over a Unix socket.')
+    parser.add_argument('-n', '--workers', type=int, default=DAEMON_WORKERS, help='number of workspaces')
+    parser.add_argument('-s', '--socket', default=DAEMON_SOCKET, help='path of the Unix socket')
+    args = parser.parse_args()
+    serve(args.socket, args.workers)
+
+
+if __name__ == '__main__':
+    main()
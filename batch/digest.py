@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+import hashlib
+
+CHUNK_SIZE = 1 << 16
+
+
+def file_digest(path):
+    """
+    Computes the SHA-256 digest of a file's content.
+    :param path: string
+    :return: string, hex digest
+    """
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def digest(*parts):
+    """
+    Computes the SHA-256 digest of a sequence of strings or bytes.
+    Parts are length-prefixed so that ('ab', 'c') and ('a', 'bc') differ.
+    :param parts: strings or bytes
+    :return: string, hex digest
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        h.update(str(len(part)).encode('ascii') + b':')
+        h.update(part)
+    return h.hexdigest()
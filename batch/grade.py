@@ -1,11 +1,11 @@
 #!/usr/bin/env python3
 
-import shutil
 import grader
+from . import metrics, result_cache
 from .constants import *
 
 
-def __report_zero(rubric_path, reason):
+def report_zero(rubric_path, reason):
     """
     Creates a zero-score report for a repository.
     :param rubric_path: string
@@ -17,6 +17,21 @@ def __report_zero(rubric_path, reason):
         f.write(text)
 
 
+def __write_rubric(rubric_path, text):
+    """
+    Writes a rubric file unless it already has the given content.
+    :param rubric_path: string
+    :param text: string
+    :return: None
+    """
+    if os.path.exists(rubric_path):
+        with open(rubric_path) as f:
+            if f.read() == text:
+                return
+    with open(rubric_path, 'w') as f:
+        f.write(text)
+
+
 def grade(repo_name, ctx):
     """
     Grades a repository for a homework by calling the grader module.
@@ -25,28 +40,101 @@ def grade(repo_name, ctx):
     :return: int, the grade
     """
     return_score = 0
-    print('> Grading', repo_name, HW_DIR)
-    hw_path = os.path.join(REPOS_DIR, repo_name, HW_DIR)
-    tests_path = os.path.join(TESTS_DIR, HW_DIR)
-    rubric_path = os.path.join(hw_path, RUBRIC_FILENAME)
+    assignment = ctx.assignment
+    print('> Grading', repo_name, assignment.hw_dir)
+    hw_path = assignment.hw_path(repo_name)
+    rubric_path = os.path.join(hw_path, assignment.rubric_filename)
+    fingerprint = result_cache.fingerprint(repo_name, grader.GRADER_VERSION, assignment)
+    cacheable = True  # crashes and timeouts can be caused by the machine, so they are retried next time
     try:
-        # Skip if graded
-        if not ctx.args.force and os.path.exists(rubric_path):
-            print('> Skip, graded')
-            return
-        # Delete existing report file
-        if os.path.exists(rubric_path):
-            os.remove(rubric_path)
+        # Skip if nothing that affects the grade has changed since the last grading
+        cached = result_cache.load(repo_name, assignment)
+        if not ctx.args.force and cached is not None and cached['fingerprint'] == fingerprint:
+            print('> Skip, unchanged since last grading')
+            __write_rubric(rubric_path, cached['report'])
+            return cached['score']
+        # Delete existing report file and test log
+        log_path = result_cache.event_log_path(repo_name, assignment)
+        for path in [rubric_path, log_path]:
+            if os.path.exists(path):
+                os.remove(path)
         # Run grader
-        argv = [tests_path, '-v', '-e', '-o', rubric_path]
-        if len(HW_FILES) > 0:
+        argv = [assignment.tests_path, '-v', '-e', '-o', rubric_path, '-l', log_path, '--timeout', str(ctx.args.timeout)]
+        if TEST_CPU_LIMIT is not None:
+            argv += ['--cpu-limit', str(TEST_CPU_LIMIT)]
+        if TEST_MEMORY_LIMIT is not None:
+            argv += ['--memory-limit', str(TEST_MEMORY_LIMIT)]
+        if ctx.tester_dir is not None:
+            argv += ['-t', ctx.tester_dir]
+        if assignment.hw_dir != HW_DIR:
+            argv.append('--local')  # the daemon's workspaces only hold the solutions of HW_DIR
+        if len(assignment.files) > 0:
             argv.append('-d')
-        for file in HW_FILES:
+        for file in assignment.files:
             argv.append(os.path.join(hw_path, file))
         return_score = grader.grade(argv)
     except FileNotFoundError as e:
-        __report_zero(rubric_path, "I cannot find the required file {0}.".format(e.filename))
-    except grader.TestingFailureError as e:
-        __report_zero(rubric_path, "Automated testing crashed.")
+        report_zero(rubric_path, "I cannot find the required file {0}.".format(e.filename))
+    except grader.TestingFailureError:
+        cacheable = False
+        report_zero(rubric_path, "Automated testing crashed.")
+    except grader.TestingTimeoutError as e:
+        cacheable = False
+        print('> Timed out:', e)
+        report_zero(rubric_path, "Automated testing timed out. {0}.".format(e))
 
+    if not cacheable:
+        # The previous result no longer matches the rubric, and must not come back on the next grade
+        result_cache.discard(repo_name, assignment)
+    elif os.path.exists(rubric_path):
+        with open(rubric_path) as f:
+            result_cache.store(repo_name, assignment, fingerprint, return_score, f.read())
     return return_score
+
+
+def grade_batch(repo_names, ctx):
+    """
+    Grades several repositories with a single elm-test run, to pay the start-up cost once.
+    Repositories that are unchanged or miss files, and all repositories of a batch that fails
+    to compile or crashes, are graded one by one instead.
+    :param repo_names: list of strings
+    :param ctx: Context
+    :return: list of grades, in the order of repo_names
+    """
+    assignment = ctx.assignment
+    tests_path = assignment.tests_path
+    batch = []
+    for repo_name in repo_names:
+        hw_path = assignment.hw_path(repo_name)
+        fingerprint = result_cache.fingerprint(repo_name, grader.GRADER_VERSION, assignment)
+        cached = result_cache.load(repo_name, assignment)
+        unchanged = not ctx.args.force and cached is not None and cached['fingerprint'] == fingerprint
+        complete = all(os.path.exists(os.path.join(hw_path, file)) for file in assignment.files)
+        if complete and not unchanged:
+            batch.append((repo_name, fingerprint))
+
+    scores = {}
+    if len(batch) > 1:
+        print('> Grading', ' '.join(repo_name for repo_name, _ in batch), assignment.hw_dir, 'in one run')
+        submissions = [(repo_name, [os.path.join(assignment.hw_path(repo_name), file) for file in assignment.files])
+                       for repo_name, _ in batch]
+        results = grader.run_batch(tests_path, submissions, tester_dir=ctx.tester_dir or ELM_TESTER_DIR,
+                                   timeout=ctx.args.timeout, verbose=True)
+        if results is None:
+            print('> Batch run failed, grading one by one')
+        else:
+            manifest = grader.load_manifest(os.path.join(tests_path, TESTS_FILENAME))
+            for repo_name, fingerprint in batch:
+                try:
+                    with metrics.timed('report', repo_name):
+                        report, score = grader.generate_report(results[repo_name], manifest)
+                except grader.TestingFailureError:
+                    continue
+                grader.save_events(results[repo_name], result_cache.event_log_path(repo_name, assignment))
+                text = report + '\n'
+                with open(os.path.join(assignment.hw_path(repo_name), assignment.rubric_filename), 'w') as f:
+                    f.write(text)
+                result_cache.store(repo_name, assignment, fingerprint, score, text)
+                scores[repo_name] = score
+
+    return [scores[repo_name] if repo_name in scores else grade(repo_name, ctx) for repo_name in repo_names]
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import csv
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+from .assignment import load_assignments
+from .constants import *
+from .summary import parse_cell
+
+REPO_COLUMN = 'Repo'
+SCORE_FIELD = 'score'
+# Summary columns of a homework: hw5 is its score, hw5_<field> anything else about it
+HW_COLUMN_PATTERN = re.compile(r'^(?P<assignment>hw\d+)(?:_(?P<field>.+))?$')
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS repos (repo TEXT PRIMARY KEY, position INTEGER NOT NULL);
+    CREATE TABLE IF NOT EXISTS columns (name TEXT PRIMARY KEY, position INTEGER NOT NULL,
+                                        assignment TEXT NOT NULL, field TEXT NOT NULL);
+    CREATE TABLE IF NOT EXISTS cells (repo TEXT NOT NULL, assignment TEXT NOT NULL, field TEXT NOT NULL, value TEXT,
+                                      PRIMARY KEY (repo, assignment, field)) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS cells_assignment ON cells (assignment, field);
+'''
+
+
+def split_column(name, assignments=()):
+    """
+    Maps a summary column to the assignment and field it holds.
+    :param name: string, e.g. 'hw5', 'hw5_reason' or 'Late_Chips_Left'
+    :param assignments: homework directories of the assignments config, for names not like hwN
+    :return: (string, string), (assignment, field); the assignment is empty for columns about the student
+    """
+    for hw_dir in sorted(assignments, key=len, reverse=True):
+        if name == hw_dir:
+            return hw_dir, SCORE_FIELD
+        if name.startswith(hw_dir + '_'):
+            return hw_dir, name[len(hw_dir) + 1:]
+    match = HW_COLUMN_PATTERN.match(name)
+    if match is not None:
+        return match.group('assignment'), match.group('field') or SCORE_FIELD
+    return '', name
+
+
+class Gradebook(object):
+    """
+    The class summary in SQLite, one row per repository, assignment and field.
+    Supports the part of the DataFrame interface that Context uses, like CsvSummary, but writes each change to disk
+    at once, so concurrent runs only ever touch the cells they set. Cell updates are grouped with transaction().
+    """
+    def __init__(self, path=GRADEBOOK_PATH):
+        """
+        :param path: string, created if missing
+        """
+        super(Gradebook, self).__init__()
+        self.path = path
+        self.db = None
+        self.lock = threading.RLock()
+        self.depth = 0
+        self.assignments = list(load_assignments())
+        self.__connect()
+
+    def __connect(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # Transactions are explicit; threads share the connection under the lock
+        self.db = sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.executescript(SCHEMA)
+
+    def __getstate__(self):
+        # Sent to worker processes by path, each opens its own connection
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def close(self):
+        self.db.close()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Makes the cell updates inside it one atomic write; nested transactions join the outer one.
+        """
+        with self.lock:
+            if self.depth == 0:
+                # Take the write lock up front, so concurrent runs wait instead of failing to upgrade
+                self.db.execute('BEGIN IMMEDIATE')
+            self.depth += 1
+            try:
+                yield self
+            except BaseException:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.db.execute('ROLLBACK')
+                raise
+            self.depth -= 1
+            if self.depth == 0:
+                self.db.execute('COMMIT')
+
+    def __column(self, name):
+        """
+        :return: (string, string), the assignment and field of a column; None if there is no such column
+        """
+        with self.lock:
+            return self.db.execute('SELECT assignment, field FROM columns WHERE name = ?', (name,)).fetchone()
+
+    def add_column(self, name):
+        """
+        Registers a summary column, after the existing ones.
+        :param name: string
+        :return: (string, string), its assignment and field
+        """
+        key = self.__column(name)
+        if key is not None:
+            return key
+        key = split_column(name, self.assignments)
+        with self.transaction():
+            self.db.execute('INSERT OR IGNORE INTO columns SELECT ?, COALESCE(MAX(position), 0) + 1, ?, ? FROM columns',
+                            (name,) + key)
+        return key
+
+    @property
+    def columns(self):
+        with self.lock:
+            return [REPO_COLUMN] + [name for name, in self.db.execute('SELECT name FROM columns ORDER BY position')]
+
+    @property
+    def index(self):
+        """
+        Rows are labelled by repository name.
+        """
+        with self.lock:
+            return [repo for repo, in self.db.execute('SELECT repo FROM repos ORDER BY position')]
+
+    def __contains__(self, column):
+        return column == REPO_COLUMN or self.__column(column) is not None
+
+    def __getitem__(self, column):
+        """
+        :param column: string
+        :return: list, the values of a column, in the order of the repositories
+        """
+        if column == REPO_COLUMN:
+            return self.index
+        assignment, field = self.__column(column) or split_column(column, self.assignments)
+        with self.lock:
+            return [parse_cell(value or '') for value, in self.db.execute('''
+                SELECT cells.value FROM repos LEFT JOIN cells
+                ON cells.repo = repos.repo AND cells.assignment = ? AND cells.field = ?
+                ORDER BY repos.position''', (assignment, field))]
+
+    def __setitem__(self, column, value):
+        """
+        Sets a whole column to one value, creating it if needed.
+        """
+        self.add_column(column)
+        if _cell_text(value) is None:
+            return  # empty cells are not stored
+        with self.transaction():
+            for repo in self.index:
+                self.set(repo, column, value)
+
+    @property
+    def at(self):
+        return _Cells(self)
+
+    def get(self, repo_name, column):
+        """
+        :param repo_name: string
+        :param column: string
+        :return: the cell value, None if it is empty
+        """
+        if column == REPO_COLUMN:
+            return repo_name
+        key = self.__column(column)
+        if key is None:
+            return None
+        with self.lock:
+            row = self.db.execute('SELECT value FROM cells WHERE repo = ? AND assignment = ? AND field = ?',
+                                  (repo_name,) + key).fetchone()
+        return None if row is None else parse_cell(row[0] or '')
+
+    def set(self, repo_name, column, value):
+        """
+        Updates a cell, creating the column if needed. Empty values delete the cell.
+        :param repo_name: string
+        :param column: string
+        :param value: new cell value
+        :return: None
+        """
+        key = self.add_column(column)
+        text = _cell_text(value)
+        with self.transaction():
+            if text is None:
+                self.db.execute('DELETE FROM cells WHERE repo = ? AND assignment = ? AND field = ?', (repo_name,) + key)
+            else:
+                self.db.execute('''INSERT INTO cells VALUES (?, ?, ?, ?)
+                                   ON CONFLICT (repo, assignment, field) DO UPDATE SET value = excluded.value''',
+                                (repo_name,) + key + (text,))
+
+    def grades(self, assignment, field=SCORE_FIELD):
+        """
+        Looks up one field of an assignment for every repository, by index.
+        :param assignment: string, homework directory
+        :param field: string
+        :return: dict, repository name -> value
+        """
+        with self.lock:
+            return {repo: parse_cell(value) for repo, value in self.db.execute(
+                'SELECT repo, value FROM cells WHERE assignment = ? AND field = ?', (assignment, field))}
+
+    def import_csv(self, source=CLASS_SUMMARY):
+        """
+        Merges a summary in the CSV layout into the gradebook, in one transaction.
+        Repositories and columns are added as needed; only cells that differ are written.
+        :param source: string, path of a CSV file, or a file object
+        :return: int, number of cells changed
+        """
+        with contextlib.ExitStack() as stack:
+            f = source if hasattr(source, 'read') else stack.enter_context(open(source, newline=''))
+            reader = csv.reader(f)
+            columns = next(reader, [])
+            rows = [dict(zip(columns, row)) for row in reader]
+        n_changed = 0
+        with self.transaction():
+            for row in rows:
+                repo_name = row.get(REPO_COLUMN, '')
+                if len(repo_name) == 0:
+                    continue
+                self.db.execute('INSERT OR IGNORE INTO repos SELECT ?, COALESCE(MAX(position), 0) + 1 FROM repos',
+                                (repo_name,))
+                for column in columns:
+                    if column == REPO_COLUMN:
+                        continue
+                    self.add_column(column)
+                    text = row.get(column, '')
+                    old = self.get(repo_name, column)
+                    if parse_cell(text) != old:
+                        self.set(repo_name, column, text or None)
+                        n_changed += 1
+        return n_changed
+
+    def export_csv(self, path=CLASS_SUMMARY):
+        """
+        Writes the gradebook in the layout of the class summary, atomically.
+        :param path: string, or a file object
+        :return: None
+        """
+        columns = self.columns
+        with self.lock:
+            cells = {}
+            for repo, name, value in self.db.execute('''
+                    SELECT cells.repo, columns.name, cells.value FROM cells JOIN columns
+                    ON columns.assignment = cells.assignment AND columns.field = cells.field'''):
+                cells[repo, name] = value
+        rows = [[repo] + [cells.get((repo, name), '') for name in columns[1:]] for repo in self.index]
+        if hasattr(path, 'write'):
+            csv.writer(path, lineterminator='\n').writerows([columns] + rows)
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.')
+        with os.fdopen(fd, 'w', newline='') as f:
+            csv.writer(f, lineterminator='\n').writerows([columns] + rows)
+        if os.path.exists(path):
+            shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+
+    def to_csv(self, path, index=False):
+        """
+        Nothing to save, every change is already in the gradebook; called like DataFrame.to_csv.
+        """
+        pass
+
+
+def _cell_text(value):
+    if value is None or value != value:  # NaN is not equal to itself
+        return None
+    return str(value)
+
+
+class _Cells(object):
+    """Cell access by repository and column, like DataFrame.at."""
+    def __init__(self, gradebook):
+        super(_Cells, self).__init__()
+        self.gradebook = gradebook
+
+    def __getitem__(self, key):
+        return self.gradebook.get(*key)
+
+    def __setitem__(self, key, value):
+        self.gradebook.set(key[0], key[1], value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move the class summary between its CSV file and the gradebook.')
+    parser.add_argument('command', choices=['import', 'export'],
+                        help='import: merge the CSV into the gradebook. export: write the gradebook as CSV')
+    parser.add_argument('csv', nargs='?', default=CLASS_SUMMARY, help='path of the CSV file')
+    parser.add_argument('-g', '--gradebook', default=GRADEBOOK_PATH, help='path of the gradebook')
+    args = parser.parse_args()
+    gradebook = Gradebook(args.gradebook)
+    try:
+        if args.command == 'import':
+            n_changed = gradebook.import_csv(args.csv)
+            print("> Imported {0} into {1}, {2} cells changed".format(args.csv, args.gradebook, n_changed))
+        else:
+            gradebook.export_csv(args.csv)
+            print("> Exported {0} to {1}".format(args.gradebook, args.csv))
+    finally:
+        gradebook.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+import json
+import threading
+import time
+from .constants import *
+
+JOURNAL_DIR = os.path.join(CACHE_DIR, 'journal')
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Journal(object):
+    """
+    On-disk record of the progress of a batch action, one JSON line per status change.
+    The last line of a repository wins, so a crashed run can be resumed from it.
+    """
+    def __init__(self, action, resume=False, identifier=HW_IDENTIFIER):
+        """
+        :param action: string, name of the batch action
+        :param resume: bool, keep the records of the previous run instead of starting afresh
+        :param identifier: string, the homeworks the action runs for
+        """
+        super(Journal, self).__init__()
+        os.makedirs(JOURNAL_DIR, exist_ok=True)
+        self.path = os.path.join(JOURNAL_DIR, "{0}-{1}.jsonl".format(action, identifier))
+        self.entries = {}
+        self.lock = threading.Lock()
+        if resume and os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn write from a crash
+                    self.entries[entry['repo']] = entry
+        # Rewrite the journal compactly, one line per repository
+        with open(self.path, 'w') as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry) + '\n')
+
+    def record(self, repo_name, status, result=None, duration=None, error=None):
+        """
+        Records the status of a repository and flushes it to disk.
+        :param repo_name: string
+        :param status: string, one of PENDING, RUNNING, DONE and FAILED
+        :param result: return value of the action
+        :param duration: float, seconds spent on the repository
+        :param error: string, why the action failed
+        :return: None
+        """
+        entry = {'repo': repo_name, 'status': status, 'result': result, 'duration': duration,
+                 'error': error, 'time': time.time()}
+        with self.lock:
+            self.entries[repo_name] = entry
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry, default=str) + '\n')
+
+    def status(self, repo_name):
+        """
+        :param repo_name: string
+        :return: string, the last recorded status, or None
+        """
+        entry = self.entries.get(repo_name)
+        return None if entry is None else entry['status']
+
+    def result(self, repo_name):
+        """
+        :param repo_name: string
+        :return: the return value recorded when the repository was done
+        """
+        return self.entries[repo_name]['result']
+
+    def failed(self):
+        """
+        :return: list of strings, the repositories whose last attempt failed
+        """
+        return [repo for repo, entry in self.entries.items() if entry['status'] == FAILED]
+
+    def on_start(self, repo_name):
+        self.record(repo_name, RUNNING)
+
+    def on_done(self, repo_name, result, error, duration):
+        if error is None:
+            self.record(repo_name, DONE, result, duration)
+        else:
+            self.record(repo_name, FAILED, None, duration, error)
@@ -1,43 +1,58 @@
 #!/usr/bin/env python3
 
-from datetime import datetime
+from datetime import datetime, timezone
 import math
-import re
-import subprocess
+import xml.etree.ElementTree as ElementTree
 from .constants import *
+from .svn import SvnError, svn
 
+SVN_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
 
-def calc_late_days(repo_name, _):
+
+def calc_late_days(repo_name, ctx):
     """
     Calculates the number of late chips used by one student for 1 assignment
     :param repo_name: string
+    :param ctx: Context
     :return: int, number of late chips
     """
-    oldest_datetime = datetime.utcfromtimestamp(0)
-    for hw_file in HW_FILES:
-        hw_path = os.path.join(REPOS_DIR, repo_name, HW_DIR, hw_file)
-
-        # Extract the date time from each file in a homework repo and find the oldest time
-        try:
-            commit_info = str(subprocess.check_output(["svn", "info", hw_path]), 'utf-8')
-            commit_datetime = get_commit_datetime(commit_info)
-            if commit_datetime > oldest_datetime:
-                oldest_datetime = commit_datetime
-
-        except subprocess.CalledProcessError as e:
+    assignment = ctx.assignment
+    hw_path = assignment.hw_path(repo_name)
+
+    # One svn call for the whole homework directory
+    try:
+        commit_datetimes = get_commit_datetimes(svn(['info', '--xml', '--depth', 'files', '.'], hw_path))
+    except SvnError as e:
+        print('> Failed to read commit times', repo_name, e)
+        commit_datetimes = {}
+
+    # The latest commit among the homework files decides
+    latest_file, latest_datetime = None, datetime.fromtimestamp(0, timezone.utc)
+    for hw_file in assignment.files:
+        if hw_file not in commit_datetimes:
             print('FILE NOT FOUND ', repo_name, hw_file)
+        elif commit_datetimes[hw_file] > latest_datetime:
+            latest_file, latest_datetime = hw_file, commit_datetimes[hw_file]
 
-    late_chips = math.ceil((oldest_datetime - DEADLINE).total_seconds() / (24 * 60 * 60))
-    return late_chips if late_chips > 0 else 0
+    late_chips = math.ceil((latest_datetime - assignment.deadline).total_seconds() / (24 * 60 * 60))
+    late_chips = late_chips if late_chips > 0 else 0
+    if latest_file is not None:
+        print("> {0}: {1} late chip(s), decided by {2} committed at {3}".format(
+            repo_name, late_chips, latest_file, latest_datetime.astimezone(assignment.deadline.tzinfo)))
+    return late_chips
 
 
-def get_commit_datetime(commit_info):
+def get_commit_datetimes(info_xml):
     """
-    Gets the datetime given a repo and a file
-    :param commit_info: string
-    :return: datetime obj, committed date
+    Gets the last commit time of each file listed in the output of `svn info --xml`
+    :param info_xml: string
+    :return: dict, file name -> timezone-aware datetime
     """
-    # Extract the date time and convert to a date time object
-    commit_info = re.findall('Last Changed Date:(.*)', commit_info)[0].split(" ")[1:3]
-    commit_datetime = datetime.strptime(commit_info[0] + " " + commit_info[1], "%Y-%m-%d %H:%M:%S")
-    return commit_datetime
+    commit_datetimes = {}
+    for entry in ElementTree.fromstring(info_xml).iter('entry'):
+        date = entry.find('commit/date')
+        if entry.get('kind') != 'file' or date is None:
+            continue  # directories, and files added but not committed yet
+        commit_datetime = datetime.strptime(date.text, SVN_DATE_FORMAT).replace(tzinfo=timezone.utc)
+        commit_datetimes[os.path.basename(entry.get('path'))] = commit_datetime
+    return commit_datetimes
@@ -1,44 +1,117 @@
 #!/usr/bin/env python3
 
 import shutil
+import stat
 import subprocess
+import tempfile
 from .constants import *
+from .digest import file_digest
+from .svn import FAILED
 
 ELM_PACKAGE_FILE = 'elm-package.json'
 ELM_STUFF_DIR = 'elm-stuff'
+PACKAGES_DIR = 'packages'
+EXACT_DEPENDENCIES_FILE = 'exact-dependencies.json'
 OUTPUT_FILE = 'Pi.html'
+MADE = 'made'
+
+
+def __set_writable(path, writable):
+    """
+    Makes a directory tree writable, or read-only.
+    """
+    for root, dirs, files in os.walk(path):
+        for name in dirs + files:
+            item = os.path.join(root, name)
+            mode = os.lstat(item).st_mode
+            if stat.S_ISLNK(mode):
+                continue
+            write_bits = stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH
+            os.chmod(item, (mode | stat.S_IWUSR) if writable else (mode & ~write_bits))
+
+
+def prepare_package_store(store_dir=PACKAGE_STORE_DIR):
+    """
+    Resolves and installs the Elm packages of FILES_DIR/elm-package.json once, into a shared read-only store.
+    The store is kept until elm-package.json changes, so later runs work offline.
+    :param store_dir: string
+    :return: None
+    """
+    package_file = os.path.join(FILES_DIR, ELM_PACKAGE_FILE)
+    store_package_file = os.path.join(store_dir, ELM_PACKAGE_FILE)
+    if os.path.exists(os.path.join(store_dir, ELM_STUFF_DIR, EXACT_DEPENDENCIES_FILE)) and \
+            file_digest(store_package_file) == file_digest(package_file):
+        return
+
+    print('> Installing Elm packages into', store_dir)
+    parent_dir = os.path.dirname(os.path.abspath(store_dir))
+    os.makedirs(parent_dir, exist_ok=True)
+    # Install next to the store and swap it in, so an interrupted install never leaves a broken store
+    tmp_dir = tempfile.mkdtemp(prefix='elm-packages-', dir=parent_dir)
+    try:
+        shutil.copy(package_file, tmp_dir)
+        subprocess.run(['elm-package', 'install', '--yes'], cwd=tmp_dir, check=True)
+        __set_writable(os.path.join(tmp_dir, ELM_STUFF_DIR, PACKAGES_DIR), False)
+        if os.path.exists(store_dir):
+            __set_writable(store_dir, True)
+            shutil.rmtree(store_dir)
+        os.replace(tmp_dir, store_dir)
+    except BaseException:
+        __set_writable(tmp_dir, True)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def __cleanup(hw_path):
+    package_path = os.path.join(hw_path, ELM_PACKAGE_FILE)
+    if os.path.exists(package_path):
+        os.remove(package_path)
+    # Removes the link to the package store, not the store itself
+    shutil.rmtree(os.path.join(hw_path, ELM_STUFF_DIR), ignore_errors=True)
+
+
+def make_log_path(repo_name):
+    """
+    :param repo_name: string
+    :return: string, where the elm-make output of a repository is saved
+    """
+    return os.path.join(EVENT_LOGS_DIR, repo_name + '.make.log')
 
 
 def make(repo_name, ctx):
     """
-    Call elm-build each repository.
+    Call elm-build each repository, with the packages of the shared package store.
     :param repo_name: string
     :param ctx: Context
-    :return: None
+    :return: string, MADE or FAILED
     """
     print('> Making', repo_name)
     hw_path = os.path.join(REPOS_DIR, repo_name, HW_DIR)
 
     # Cleanup
-    try:
-        os.remove(os.path.join(hw_path, ELM_PACKAGE_FILE))
-        shutil.rmtree(os.path.join(hw_path, ELM_STUFF_DIR))
-    except FileNotFoundError:
-        pass
+    __cleanup(hw_path)
 
-    # Copy the elm-package.json file
+    # Copy the elm-package.json file, and link the installed packages so elm-make has nothing to download
     shutil.copy(os.path.join(FILES_DIR, ELM_PACKAGE_FILE), hw_path)
+    elm_stuff_path = os.path.join(hw_path, ELM_STUFF_DIR)
+    os.makedirs(elm_stuff_path)
+    os.symlink(os.path.join(os.path.abspath(PACKAGE_STORE_DIR), ELM_STUFF_DIR, PACKAGES_DIR),
+               os.path.join(elm_stuff_path, PACKAGES_DIR))
+    shutil.copy(os.path.join(PACKAGE_STORE_DIR, ELM_STUFF_DIR, EXACT_DEPENDENCIES_FILE), elm_stuff_path)
 
     # Make
-    ret = subprocess.call(['elm-make', '--yes'] + HW_FILES + ['--output', OUTPUT_FILE], cwd=hw_path)
+    proc = subprocess.run(['elm-make', '--yes'] + HW_FILES + ['--output', OUTPUT_FILE], cwd=hw_path,
+                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    os.makedirs(EVENT_LOGS_DIR, exist_ok=True)
+    with open(make_log_path(repo_name), 'w') as f:
+        f.write(proc.stdout)
+    if proc.returncode != 0:
+        print("> {0} did not compile, see {1}".format(repo_name, make_log_path(repo_name)))
 
     # Open
-    if ret == 0 and ctx.args.open:
+    if proc.returncode == 0 and ctx.args.open:
         subprocess.call(['open', OUTPUT_FILE], cwd=hw_path)
 
     # Cleanup
-    try:
-        os.remove(os.path.join(hw_path, ELM_PACKAGE_FILE))
-        shutil.rmtree(os.path.join(hw_path, ELM_STUFF_DIR))
-    except FileNotFoundError:
-        pass
+    __cleanup(hw_path)
+    return MADE if proc.returncode == 0 else FAILED
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+from contextlib import contextmanager
+import csv
+import json
+import math
+import threading
+import time
+import uuid
+from .constants import *
+
+# Carries the current run to worker processes and to the grader
+METRICS_ENV = 'GRADER_METRICS'
+FIELDS = ['run', 'action', 'repo', 'phase', 'seconds', 'time']
+SLOWEST_REPOS = 5
+
+_local = threading.local()
+
+
+def start_run(action, path=METRICS_PATH):
+    """
+    Starts recording timings for a batch action. Processes started afterwards record into the same run.
+    :param action: string
+    :param path: string, JSON lines file the timings are appended to
+    :return: string, the run id
+    """
+    run_id = uuid.uuid4().hex[:12]
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    os.environ[METRICS_ENV] = json.dumps({'run': run_id, 'action': action, 'path': os.path.abspath(path)})
+    return run_id
+
+
+def __current_run():
+    value = os.environ.get(METRICS_ENV)
+    return None if value is None else json.loads(value)
+
+
+def set_repo(repo_name):
+    """
+    Sets the repository that timings recorded by this thread belong to.
+    :param repo_name: string, or None
+    :return: None
+    """
+    _local.repo = repo_name
+
+
+def record(phase, seconds, repo_name=None):
+    """
+    Records the duration of a phase; does nothing unless a run was started.
+    :param phase: string
+    :param seconds: float
+    :param repo_name: string, defaults to the repository set by set_repo
+    :return: None
+    """
+    run = __current_run()
+    if run is None:
+        return
+    if repo_name is None:
+        repo_name = getattr(_local, 'repo', None)
+    entry = {'run': run['run'], 'action': run['action'], 'repo': repo_name, 'phase': phase,
+             'seconds': round(seconds, 6), 'time': time.time()}
+    # A single short append is atomic, so processes can share the file
+    with open(run['path'], 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+
+
+@contextmanager
+def timed(phase, repo_name=None):
+    """
+    Times the enclosed block as a phase.
+    :param phase: string
+    :param repo_name: string, defaults to the repository set by set_repo
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(phase, time.perf_counter() - start, repo_name)
+
+
+def load_run(run_id, path=METRICS_PATH):
+    """
+    :param run_id: string
+    :param path: string
+    :return: list of dicts, the timings recorded in a run
+    """
+    entries = []
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry['run'] == run_id:
+                entries.append(entry)
+    return entries
+
+
+def export_csv(entries, csv_path):
+    """
+    Writes timings to a CSV file.
+    :param entries: list of dicts
+    :param csv_path: string
+    :return: None
+    """
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(entries)
+
+
+def __percentile(values, p):
+    """
+    Nearest-rank percentile of sorted values.
+    """
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def summarize(entries):
+    """
+    Prints the p50/p95/max duration of every phase and the slowest repositories.
+    :param entries: list of dicts
+    :return: None
+    """
+    phases = {}
+    for entry in entries:
+        phases.setdefault(entry['phase'], []).append(entry['seconds'])
+    print('> Timings (seconds):')
+    print("  {0:<16}{1:>7}{2:>10}{3:>10}{4:>10}{5:>10}".format('phase', 'count', 'p50', 'p95', 'max', 'total'))
+    for phase, values in sorted(phases.items(), key=lambda item: -sum(item[1])):
+        values.sort()
+        print("  {0:<16}{1:>7}{2:>10.3f}{3:>10.3f}{4:>10.3f}{5:>10.3f}".format(
+            phase, len(values), __percentile(values, 50), __percentile(values, 95), values[-1], sum(values)))
+
+    totals = [entry for entry in entries if entry['phase'] == 'repo']
+    totals.sort(key=lambda entry: -entry['seconds'])
+    if len(totals) > 0:
+        print('> Slowest repositories:')
+        for entry in totals[:SLOWEST_REPOS]:
+            print("  {0}: {1:.3f}".format(entry['repo'], entry['seconds']))
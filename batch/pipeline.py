@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+
+import copy
+import queue
+import tempfile
+import threading
+import time
+import traceback
+from . import metrics
+from .assignment import NO_HOMEWORK, for_assignments, has_homework
+from .grade import grade
+from .pull import pull
+from .push import push
+from .sandbox import create_sandbox
+from .svn import FAILED
+
+STAGES = ['pull', 'grade', 'push']
+STAGE_WORKERS = {'pull': 4, 'grade': 2, 'push': 4}
+QUEUE_SIZE = 4  # repositories waiting between two stages; a full queue holds back the stage before it
+PROGRESS_INTERVAL = 10  # seconds
+_DONE = None  # tells a stage worker to stop
+
+
+def stage_failed(ret):
+    """
+    :param ret: return value of a stage, or a dict of them per assignment
+    :return: bool
+    """
+    return ret == FAILED or (isinstance(ret, dict) and FAILED in ret.values())
+
+
+def pipeline(repo_name, ctx):
+    """
+    Pulls, grades and pushes one repository, for each selected assignment.
+    :param repo_name: string
+    :param ctx: Context
+    :return: int, the grade, or a dict of grades per assignment if several are selected;
+        NO_HOMEWORK if the repository has no homework directory
+    """
+    if pull(repo_name, ctx) == FAILED:
+        raise RuntimeError('pull failed')
+    if not has_homework(repo_name, ctx):
+        return NO_HOMEWORK
+    score = for_assignments(grade, ctx)(repo_name, ctx)
+    if stage_failed(for_assignments(push, ctx)(repo_name, ctx)):
+        raise RuntimeError('push failed')
+    return score
+
+
+class Stage(object):
+    """One step of the pipeline: a pool of worker threads taking repositories from a bounded queue."""
+    def __init__(self, name, workers):
+        """
+        :param name: string, one of STAGES
+        :param workers: int
+        """
+        super(Stage, self).__init__()
+        self.name = name
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.running = 0
+        self.blocked = 0  # finished workers waiting for room in the next stage's queue
+        self.done = 0
+        self.lock = threading.Lock()
+
+    def progress(self):
+        """
+        :return: string, a short description of the stage's state
+        """
+        return "{0}: {1} queued, {2}/{3} busy, {4} blocked, {5} done".format(
+            self.name, self.queue.qsize(), self.running, self.workers, self.blocked, self.done)
+
+
+class Pipeline(object):
+    """Streams repositories through pull, grade and push, so that the stages of different repositories overlap."""
+    def __init__(self, ctx, workers=None, on_start=None, on_done=None):
+        """
+        :param ctx: Context
+        :param workers: dict, stage name -> number of workers; defaults to STAGE_WORKERS
+        :param on_start: function(repo_name), called when a repository enters the pipeline
+        :param on_done: function(repo_name, return value, error, duration), called when a repository leaves it
+        """
+        super(Pipeline, self).__init__()
+        self.ctx = ctx
+        workers = dict(STAGE_WORKERS, **(workers or {}))
+        self.stages = [Stage(name, workers[name]) for name in STAGES]
+        self.on_start = on_start
+        self.on_done = on_done
+        self.started = {}
+        self.scores = {}
+        self.finished = threading.Event()
+        self.lock = threading.Lock()
+
+    def run(self, repo_names):
+        """
+        Runs every repository through the pipeline and waits until all are done.
+        :param repo_names: list of strings
+        :return: list, the grades, in the order of repo_names; None for repositories that failed
+        """
+        results = {}
+        with tempfile.TemporaryDirectory(prefix='grader-') as sandbox_root:
+            threads = []
+            for i, stage in enumerate(self.stages):
+                for _ in range(stage.workers):
+                    ctx = self.ctx
+                    if stage.name == 'grade' and stage.workers > 1:
+                        # Every grading worker tests in its own elm-tester
+                        ctx = copy.copy(self.ctx)
+                        ctx.tester_dir = create_sandbox(sandbox_root)
+                    thread = threading.Thread(target=self.__work, args=(i, ctx, results), daemon=True)
+                    thread.start()
+                    threads.append(thread)
+            monitor = threading.Thread(target=self.__monitor, daemon=True)
+            monitor.start()
+
+            # Feeding blocks while the first queue is full
+            for repo_name in repo_names:
+                with self.lock:
+                    self.started[repo_name] = time.time()
+                if self.on_start is not None:
+                    self.on_start(repo_name)
+                self.stages[0].queue.put((repo_name, time.time()))
+
+            # Stop every stage once the one before it has drained
+            for i, stage in enumerate(self.stages):
+                for _ in range(stage.workers):
+                    stage.queue.put(_DONE)
+                for thread in threads[sum(s.workers for s in self.stages[:i]):][:stage.workers]:
+                    thread.join()
+            self.finished.set()
+            monitor.join()
+            print('> Pipeline done.', ' | '.join(stage.progress() for stage in self.stages))
+        return [results.get(repo_name) for repo_name in repo_names]
+
+    def __finish(self, repo_name, results, ret, error):
+        with self.lock:
+            duration = time.time() - self.started.pop(repo_name)
+            if error is None:
+                results[repo_name] = ret
+        metrics.record('repo', duration, repo_name)
+        if self.on_done is not None:
+            self.on_done(repo_name, ret, error, duration)
+
+    def __work(self, i, ctx, results):
+        stage = self.stages[i]
+        next_stage = self.stages[i + 1] if i + 1 < len(self.stages) else None
+        fn = {'pull': pull, 'grade': for_assignments(grade, ctx), 'push': for_assignments(push, ctx)}[stage.name]
+        while True:
+            item = stage.queue.get()
+            if item is _DONE:
+                return
+            repo_name, queued = item
+            metrics.set_repo(repo_name)
+            metrics.record('wait ' + stage.name, time.time() - queued)
+            with stage.lock:
+                stage.running += 1
+            try:
+                with metrics.timed('stage ' + stage.name):
+                    ret = fn(repo_name, ctx)
+                error = None
+                if stage_failed(ret):
+                    error = "{0} failed".format(stage.name)
+            except Exception as e:
+                traceback.print_exc()
+                ret, error = None, "{0}: {1}".format(type(e).__name__, e)
+            with stage.lock:
+                stage.running -= 1
+                stage.done += 1
+
+            if stage.name == 'grade' and error is None:
+                with self.lock:
+                    self.scores[repo_name] = ret
+            if error is not None:
+                self.__finish(repo_name, results, None, error)
+            elif stage.name == 'pull' and not has_homework(repo_name, ctx):
+                print("> Repository {0} does not have homework {1}, skipping".format(
+                    repo_name, ', '.join(assignment.hw_dir for assignment in ctx.assignments)))
+                self.__finish(repo_name, results, NO_HOMEWORK, None)
+            elif next_stage is None:
+                with self.lock:
+                    score = self.scores.pop(repo_name)
+                self.__finish(repo_name, results, score, None)
+            else:
+                # Blocks while the next stage is behind: backpressure
+                with stage.lock:
+                    stage.blocked += 1
+                next_stage.queue.put((repo_name, time.time()))
+                with stage.lock:
+                    stage.blocked -= 1
+
+    def __monitor(self):
+        while not self.finished.wait(PROGRESS_INTERVAL):
+            print('> Pipeline', ' | '.join(stage.progress() for stage in self.stages))
+
+
+def run_pipeline(repo_names, ctx, workers=None, on_start=None, on_done=None):
+    """
+    Streams repositories through pull, grade and push.
+    :param repo_names: list of strings
+    :param ctx: Context
+    :param workers: dict, stage name -> number of workers
+    :param on_start: function(repo_name)
+    :param on_done: function(repo_name, return value, error, duration)
+    :return: list, the grades, in the order of repo_names; None for repositories that failed
+    """
+    return Pipeline(ctx, workers, on_start, on_done).run(repo_names)
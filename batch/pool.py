@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+import tempfile
+import time
+import traceback
+from . import metrics
+from .sandbox import create_sandbox
+
+_worker_fn = None
+_worker_ctx = None
+
+
+def __init_worker(fn, ctx, sandbox_root):
+    """
+    Sets up a pool worker, with its own elm-tester sandbox if the action tests.
+    :param fn: function, the action to run
+    :param ctx: Context
+    :param sandbox_root: string, directory holding all sandboxes of this run; None if the action does not test
+    :return: None
+    """
+    global _worker_fn, _worker_ctx
+    if sandbox_root is not None:
+        ctx.tester_dir = create_sandbox(sandbox_root)
+    _worker_fn = fn
+    _worker_ctx = ctx
+
+
+def __call(fn, item, ctx):
+    """
+    Runs an action on one repository, or a chunk of them, catching its failure so the others can proceed.
+    :return: (return value, error message or None, duration in seconds)
+    """
+    start = time.time()
+    # Timings recorded while a chunk runs are not attributed to any single repository
+    metrics.set_repo(item if isinstance(item, str) else None)
+    try:
+        return fn(item, ctx), None, time.time() - start
+    except Exception as e:
+        traceback.print_exc()
+        return None, "{0}: {1}".format(type(e).__name__, e), time.time() - start
+
+
+def __run_in_worker(item):
+    return __call(_worker_fn, item, _worker_ctx)
+
+
+def map_repos(fn, repo_names, ctx, jobs=1, threads=False, on_start=None, on_done=None, chunk_size=1, sandboxes=True):
+    """
+    Runs an action over repositories, in parallel if more than one job is requested.
+    Results are returned in the same order as repo_names.
+    :param fn: function, the action to run
+    :param repo_names: list of strings
+    :param ctx: Context
+    :param jobs: int, number of workers
+    :param threads: bool, use threads sharing ctx instead of processes with their own elm-tester sandbox
+    :param on_start: function(repo_name), called when a repository is handed to a worker
+    :param on_done: function(repo_name, return value, error, duration), called as each repository finishes
+    :param chunk_size: int, if more than 1, fn takes a list of up to chunk_size repositories and returns a list
+    :param sandboxes: bool, give every process worker its own copy of elm-tester; only actions that test need it
+    :return: list, return values of fn; None for repositories that failed
+    """
+    results = [None] * len(repo_names)
+    if chunk_size > 1:
+        items = [repo_names[i:i + chunk_size] for i in range(0, len(repo_names), chunk_size)]
+    else:
+        items = repo_names
+
+    def start(i):
+        if on_start is not None:
+            for repo_name in (items[i] if chunk_size > 1 else [items[i]]):
+                on_start(repo_name)
+
+    def finish(i, outcome):
+        ret, error, duration = outcome
+        if chunk_size > 1:
+            chunk = items[i]
+            rets = ret if error is None else [None] * len(chunk)
+            outcomes = [(r, error, duration / len(chunk)) for r in rets]
+            first = i * chunk_size
+        else:
+            chunk, outcomes, first = [items[i]], [outcome], i
+        for j, (repo_name, repo_outcome) in enumerate(zip(chunk, outcomes)):
+            results[first + j] = repo_outcome[0]
+            metrics.record('repo', repo_outcome[2], repo_name)
+            if on_done is not None:
+                on_done(repo_name, *repo_outcome)
+
+    if jobs is None or jobs <= 1 or len(items) <= 1:
+        for i, item in enumerate(items):
+            start(i)
+            finish(i, __call(fn, item, ctx))
+        return results
+
+    # Loads multiprocessing, which serial runs do without
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+    with tempfile.TemporaryDirectory(prefix='grader-') as sandbox_root:
+        if threads:
+            executor = ThreadPoolExecutor(max_workers=jobs)
+        else:
+            executor = ProcessPoolExecutor(max_workers=jobs, initializer=__init_worker,
+                                           initargs=(fn, ctx, sandbox_root if sandboxes else None))
+        with executor:
+            futures = {}
+            for i, item in enumerate(items):
+                start(i)
+                if threads:
+                    futures[executor.submit(__call, fn, item, ctx)] = i
+                else:
+                    futures[executor.submit(__run_in_worker, item)] = i
+            for future in as_completed(futures):
+                finish(futures[future], future.result())
+    return results
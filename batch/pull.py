@@ -1,23 +1,137 @@
 #!/usr/bin/env python3
 
-import subprocess
+import json
+import re
+import tempfile
+import threading
 from .constants import *
+from .svn import FAILED, SvnError, head_revisions, svn
 
-REPO_URL_PREFIX = 'https://phoenixforge.cs.uchicago.edu/svn/'
+UNCHANGED = 'unchanged'
+CHANGED = ['updated', 'checked out']
+REVISION_PATTERN = re.compile(r'^(?:At|Updated to|Checked out) revision (\d+)\.$', re.MULTILINE)
+COMMIT_PATTERN = re.compile(r'^Committed revision (\d+)\.$', re.MULTILINE)
 
+_revisions_lock = threading.Lock()
 
-def pull(repo_name, _):
+
+def load_revisions():
+    """
+    :return: dict, repository name -> revision its working copy was last updated to
+    """
+    try:
+        with open(SVN_REVISIONS_PATH) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def __record_revision(repo_name, output):
+    """
+    Records the revision an svn checkout or update brought a working copy to.
+    :param output: string, standard output of svn
     """
-    Checks out or updates a repository.
+    revisions = [int(revision) for revision in REVISION_PATTERN.findall(output)]
+    if len(revisions) == 0:
+        return
+    with _revisions_lock:
+        synced = load_revisions()
+        synced[repo_name] = revisions[-1]
+        __save_revisions(synced)
+
+
+def __save_revisions(synced):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR)
+    with os.fdopen(fd, 'w') as f:
+        json.dump(synced, f, indent=0, sort_keys=True)
+    os.replace(tmp_path, SVN_REVISIONS_PATH)
+
+
+def record_commit(repo_name, output):
+    """
+    Records the revision of a commit by the grader, so the next pull does not take it for new work.
+    Only a commit right after the revision the working copy was last updated to is recorded;
+    if anyone else committed in between, the next pull still updates the repository and lists it as changed.
     :param repo_name: string
-    :param _: unused
+    :param output: string, standard output of svn commit
     :return: None
     """
+    match = COMMIT_PATTERN.search(output)
+    if match is None:
+        return
+    revision = int(match.group(1))
+    with _revisions_lock:
+        synced = load_revisions()
+        if synced.get(repo_name) != revision - 1:
+            return
+        synced[repo_name] = revision
+        __save_revisions(synced)
+
+
+def check_heads(repo_names, ctx):
+    """
+    Finds the latest revision of every repository in bulk, so pull can skip the ones without new commits.
+    :param repo_names: list of strings
+    :param ctx: Context
+    :return: None
+    """
+    ctx.head_revisions = head_revisions(repo_names, ctx.args.svn_url)
+    synced = load_revisions()
+    n_new = sum(1 for repo_name in repo_names if repo_name not in synced or
+                ctx.head_revisions.get(repo_name, float('inf')) > synced[repo_name])
+    print("> {0} of {1} repositories have new revisions".format(n_new, len(repo_names)))
+
+
+def pull(repo_name, ctx):
+    """
+    Checks out or updates a repository, unless it has no revisions since it was last pulled.
+    :param repo_name: string
+    :param ctx: Context
+    :return: string, status
+    """
     repo_path = os.path.join(REPOS_DIR, repo_name)
-    if os.path.exists(repo_path):
-        print('> Updating', repo_name)
-        subprocess.call(['svn', 'up'], cwd=repo_path)
-    else:
-        print('> Checking out', repo_name)
-        repo_url = os.path.join(REPO_URL_PREFIX, repo_name)
-        subprocess.call(['svn', 'co', repo_url], cwd=REPOS_DIR)
+    try:
+        if os.path.exists(repo_path):
+            head = ctx.head_revisions.get(repo_name) if ctx.head_revisions is not None else None
+            synced = load_revisions().get(repo_name)
+            if not ctx.args.force and head is not None and synced is not None and head <= synced:
+                print('> Unchanged', repo_name, "(revision {0})".format(synced))
+                return UNCHANGED
+            print('> Updating', repo_name)
+            __record_revision(repo_name, svn(['up'], repo_path))
+            return 'updated'
+        else:
+            print('> Checking out', repo_name)
+            repo_url = os.path.join(ctx.args.svn_url, repo_name)
+            __record_revision(repo_name, svn(['co', repo_url], REPOS_DIR))
+            return 'checked out'
+    except SvnError as e:
+        print('> Failed to pull', repo_name, e)
+        return FAILED
+
+
+def save_changed(repo_names, statuses):
+    """
+    Saves the repositories that pull brought new revisions into, for later actions' --changed.
+    :param repo_names: list of strings
+    :param statuses: list of strings, as returned by pull
+    :return: list of strings, the changed repositories
+    """
+    changed = [repo for repo, status in zip(repo_names, statuses) if status in CHANGED]
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(CHANGED_REPOS_PATH, 'w') as f:
+        f.write(''.join(repo + '\n' for repo in changed))
+    print("> {0} repositories changed, saved to {1}".format(len(changed), CHANGED_REPOS_PATH))
+    return changed
+
+
+def load_changed():
+    """
+    :return: set of strings, the repositories the last pull found new revisions in
+    """
+    try:
+        with open(CHANGED_REPOS_PATH) as f:
+            return set(line.strip() for line in f if len(line.strip()) > 0)
+    except FileNotFoundError:
+        raise RuntimeError("> No list of changed repositories, run pull first")
@@ -1,23 +1,30 @@
 #!/usr/bin/env python3
 
-import subprocess
 from .constants import *
+from .pull import record_commit
+from .svn import FAILED, SvnError, svn
 
-REPO_URL_PREFIX = 'https://phoenixforge.cs.uchicago.edu/svn/'
 
-
-def push(repo_name, _):
+def push(repo_name, ctx):
     """
     Push changes in a homework directory.
     :param repo_name: string
-    :param _: unused
-    :return: None
+    :param ctx: Context
+    :return: string, status
     """
-    hw_path = os.path.join(REPOS_DIR, repo_name, HW_DIR)
+    assignment = ctx.assignment
+    hw_path = assignment.hw_path(repo_name)
     if not os.path.exists(hw_path):
         print('> Skipping', repo_name)
-        return
+        return 'skipped'
 
     print('> Pushing', repo_name)
-    subprocess.call(['svn', 'add', RUBRIC_FILENAME], cwd=hw_path)
-    subprocess.call(['svn', 'ci',RUBRIC_FILENAME, '-m', '"Graded {}"'.format(HW_DIR)], cwd=hw_path)
+    try:
+        svn(['add', '--force', assignment.rubric_filename], hw_path)
+        output = svn(['ci', assignment.rubric_filename, '-m', '"Graded {}"'.format(assignment.hw_dir)], hw_path)
+        # Our own commit is not new work for the next pull
+        record_commit(repo_name, output)
+        return 'pushed'
+    except SvnError as e:
+        print('> Failed to push', repo_name, e)
+        return FAILED
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+import grader
+from . import metrics, result_cache
+from .constants import *
+from .grade import report_zero
+
+def rescore(repo_name, ctx):
+    """
+    Regenerates the rubric of a repository from its saved elm-test event log, without running any tests.
+    Repositories without a log (missing files, time-outs) keep their rubric, and their cached score
+    if it is for the current submission.
+    :param repo_name: string
+    :param ctx: Context
+    :return: int, the grade
+    """
+    assignment = ctx.assignment
+    print('> Rescoring', repo_name, assignment.hw_dir)
+    rubric_path = os.path.join(assignment.hw_path(repo_name), assignment.rubric_filename)
+    log_path = result_cache.event_log_path(repo_name, assignment)
+    tests_path = os.path.join(assignment.tests_path, TESTS_FILENAME)
+    if not os.path.exists(log_path):
+        print('> No test log, keeping rubric')
+        cached = result_cache.load(repo_name, assignment)
+        fingerprint = result_cache.fingerprint(repo_name, grader.GRADER_VERSION, assignment)
+        # A score cached for an earlier version of the submission does not match the rubric
+        if cached is None or cached['fingerprint'] != fingerprint:
+            return 0
+        return cached['score']
+
+    try:
+        with metrics.timed('report'):
+            report, score = grader.generate_report(grader.load_events(log_path), grader.load_manifest(tests_path))
+        with open(rubric_path, 'w') as f:
+            print(report, file=f)
+    except grader.TestingFailureError:
+        score = 0
+        report_zero(rubric_path, "Automated testing crashed.")
+
+    with open(rubric_path) as f:
+        result_cache.update(repo_name, assignment, score, f.read())
+    return score
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+import json
+import tempfile
+from .constants import *
+from .digest import digest, file_digest
+
+RESULTS_DIR = os.path.join(CACHE_DIR, 'results')
+
+_tests_digests = {}
+
+
+def __tree_digest(root):
+    """
+    Hashes every file below a directory, including their relative paths.
+    :param root: string
+    :return: string, hex digest
+    """
+    parts = []
+    for dir_path, dirs, files in os.walk(root):
+        dirs.sort()
+        for file in sorted(files):
+            path = os.path.join(dir_path, file)
+            parts += [os.path.relpath(path, root), file_digest(path)]
+    return digest(*parts)
+
+
+def __tests_digest(assignment):
+    """
+    Hashes the tests directory and the solution files of a homework; computed once per run.
+    :param assignment: Assignment
+    :return: string, hex digest
+    """
+    if assignment.hw_dir not in _tests_digests:
+        parts = [__tree_digest(assignment.tests_path)]
+        for solution in assignment.solutions:
+            parts += [solution, file_digest(os.path.join(assignment.tests_path, 'solution', solution))]
+        _tests_digests[assignment.hw_dir] = digest(*parts)
+    return _tests_digests[assignment.hw_dir]
+
+
+def fingerprint(repo_name, grader_version, assignment):
+    """
+    Computes the fingerprint of a submission: everything that can change its grade.
+    :param repo_name: string
+    :param grader_version: string
+    :param assignment: Assignment
+    :return: string, hex digest
+    """
+    hw_path = assignment.hw_path(repo_name)
+    parts = [grader_version, __tests_digest(assignment)]
+    for file in assignment.files:
+        path = os.path.join(hw_path, file)
+        parts += [file, file_digest(path) if os.path.exists(path) else 'missing']
+    return digest(*parts)
+
+
+def event_log_path(repo_name, assignment):
+    """
+    Path of the raw elm-test event log of a repository for a homework.
+    :param repo_name: string
+    :param assignment: Assignment
+    :return: string
+    """
+    return os.path.join(assignment.event_logs_dir, repo_name + '.jsonl')
+
+
+def __result_path(repo_name, assignment):
+    return os.path.join(RESULTS_DIR, assignment.identifier, repo_name + '.json')
+
+
+def load(repo_name, assignment):
+    """
+    Loads the cached grading result of a repository.
+    :param repo_name: string
+    :param assignment: Assignment
+    :return: dict with keys fingerprint, score and report; None if not graded before
+    """
+    try:
+        with open(__result_path(repo_name, assignment)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def store(repo_name, assignment, fingerprint, score, report):
+    """
+    Saves the grading result of a repository.
+    :param repo_name: string
+    :param assignment: Assignment
+    :param fingerprint: string, as computed by fingerprint()
+    :param score: number
+    :param report: string, rubric text
+    :return: None
+    """
+    result_path = __result_path(repo_name, assignment)
+    os.makedirs(os.path.dirname(result_path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(result_path))
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'fingerprint': fingerprint, 'score': score, 'report': report}, f)
+    os.replace(tmp_path, result_path)
+
+
+def discard(repo_name, assignment):
+    """
+    Forgets the cached grading result of a repository, so it is graded again next time.
+    :param repo_name: string
+    :param assignment: Assignment
+    :return: None
+    """
+    try:
+        os.remove(__result_path(repo_name, assignment))
+    except FileNotFoundError:
+        pass
+
+
+def update(repo_name, assignment, score, report):
+    """
+    Replaces the score and report of a cached result, keeping its fingerprint.
+    :param repo_name: string
+    :param assignment: Assignment
+    :param score: number
+    :param report: string, rubric text
+    :return: None
+    """
+    cached = load(repo_name, assignment)
+    if cached is not None:
+        store(repo_name, assignment, cached['fingerprint'], score, report)
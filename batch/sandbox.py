@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+
+import shutil
+import tempfile
+from .constants import *
+
+
+def install_solutions(tester_dir, assignment=None):
+    """
+    Copies the solution modules of a homework into an elm-tester project.
+    :param tester_dir: string, path to the elm-tester project
+    :param assignment: Assignment; None for the homework of HW_DIR
+    :return: None
+    """
+    tests_path = os.path.join(TESTS_DIR, HW_DIR) if assignment is None else assignment.tests_path
+    for solution in SOLUTION_FILES if assignment is None else assignment.solutions:
+        shutil.copy(os.path.join(tests_path, 'solution', solution), os.path.join(tester_dir, 'tests'))
+
+
+def create_sandbox(parent_dir):
+    """
+    Creates a private copy of the elm-tester project, so that several graders can run at once.
+    The copy includes the installed Elm packages and whatever solutions are already in place.
+    :param parent_dir: string, directory to create the sandbox in
+    :return: string, path to the copied elm-tester project
+    """
+    sandbox_dir = tempfile.mkdtemp(prefix='elm-tester-', dir=parent_dir)
+    tester_dir = os.path.join(sandbox_dir, 'elm-tester')
+    shutil.copytree(ELM_TESTER_DIR, tester_dir, symlinks=True)
+    return tester_dir
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+import csv
+import random
+import re
+import sqlite3
+import zlib
+import numpy as np
+from .constants import *
+from .digest import file_digest
+
+ELM_TOKEN_PATTERN = re.compile(r'''
+    (?P<comment>--[^\n]*|\{-.*?-\})
+  | (?P<string>"""(?:.|\n)*?"""|"(?:\\.|[^"\\\n])*")
+  | (?P<char>'(?:\\.|[^'\\\n])+')
+  | (?P<number>0x[0-9a-fA-F]+|\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+  | (?P<name>[A-Za-z_][\w']*(?:\.[A-Za-z_][\w']*)*)
+  | (?P<operator>[-+*/<>=|&^.:!?%$#@~\\]+)
+  | (?P<punctuation>[(),\[\]{}`])
+''', re.VERBOSE | re.DOTALL)
+HEADER_PATTERN = re.compile(r'^(?:port\s+)?(?:module|import)\b.*$', re.MULTILINE)
+KEYWORDS = {'if', 'then', 'else', 'case', 'of', 'let', 'in', 'type', 'alias', 'port', 'where', 'as', 'exposing'}
+
+SHINGLE_SIZE = 5  # tokens per shingle
+NUM_PERMUTATIONS = 128
+BANDS = 16  # of NUM_PERMUTATIONS // BANDS rows; pairs above about (1 / BANDS) ** (BANDS / NUM_PERMUTATIONS) collide
+PRIME = (1 << 31) - 1
+SIMILARITY_REPORT = os.path.join(os.path.dirname(SIMILARITY_INDEX), "{0}-{1}.csv".format(SEMESTER, HW_IDENTIFIER))
+
+# Fixed, so that signatures stay comparable across runs, homeworks and semesters
+_rng = random.Random(22300)
+_a = np.array([_rng.randrange(1, PRIME) for _ in range(NUM_PERMUTATIONS)], dtype=np.uint64)
+_b = np.array([_rng.randrange(0, PRIME) for _ in range(NUM_PERMUTATIONS)], dtype=np.uint64)
+
+
+def tokenize(source):
+    """
+    Normalizes an Elm module into tokens that survive renaming and reformatting:
+    comments, whitespace, the module header and imports are dropped, and names and literals are replaced by their kind.
+    :param source: string
+    :return: list of strings
+    """
+    tokens = []
+    for match in ELM_TOKEN_PATTERN.finditer(HEADER_PATTERN.sub('', source)):
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == 'comment':
+            continue
+        elif kind == 'name':
+            tokens.append(text if text in KEYWORDS else 'ID')
+        elif kind in ('string', 'char', 'number'):
+            tokens.append(kind.upper())
+        else:
+            tokens.append(text)
+    return tokens
+
+
+def signature(tokens):
+    """
+    Computes the MinHash signature of the shingles of a token list.
+    :param tokens: list of strings
+    :return: list of ints, NUM_PERMUTATIONS long; None if there are too few tokens
+    """
+    if len(tokens) < SHINGLE_SIZE:
+        return None
+    shingles = set(zlib.crc32('\x1f'.join(tokens[i:i + SHINGLE_SIZE]).encode('utf-8'))
+                   for i in range(len(tokens) - SHINGLE_SIZE + 1))
+    x = np.fromiter(shingles, dtype=np.uint64, count=len(shingles)) % PRIME
+    return ((_a[:, None] * x[None, :] + _b[:, None]) % PRIME).min(axis=1).tolist()
+
+
+def __bands(sig):
+    rows = NUM_PERMUTATIONS // BANDS
+    return [(band, ','.join(map(str, sig[band * rows:(band + 1) * rows]))) for band in range(BANDS)]
+
+
+def __key(repo_name, filename):
+    return '/'.join([SEMESTER, HW_IDENTIFIER, repo_name, filename])
+
+
+def open_index(path=SIMILARITY_INDEX):
+    """
+    Opens the LSH index of module signatures, creating it if needed.
+    :param path: string
+    :return: sqlite3.Connection
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    db = sqlite3.connect(path, timeout=60)
+    db.executescript('''
+        CREATE TABLE IF NOT EXISTS signatures (key TEXT PRIMARY KEY, digest TEXT, signature TEXT);
+        CREATE TABLE IF NOT EXISTS buckets (band INTEGER, bucket TEXT, key TEXT);
+        CREATE INDEX IF NOT EXISTS buckets_lookup ON buckets (band, bucket);
+        CREATE INDEX IF NOT EXISTS buckets_key ON buckets (key);
+    ''')
+    return db
+
+
+def similarity(repo_name, ctx):
+    """
+    Computes the signatures of the modules of a repository that changed since they were last indexed.
+    :param repo_name: string
+    :param ctx: Context
+    :return: dict, index key -> [file digest, signature]; the signature is None for an unchanged module,
+        and empty for a module too short to compare
+    """
+    hw_path = os.path.join(REPOS_DIR, repo_name, HW_DIR)
+    db = open_index()
+    try:
+        signatures = {}
+        for filename in HW_FILES:
+            path = os.path.join(hw_path, filename)
+            if not os.path.exists(path):
+                continue
+            key = __key(repo_name, filename)
+            file_hash = file_digest(path)
+            row = db.execute('SELECT digest FROM signatures WHERE key = ?', (key,)).fetchone()
+            if row is not None and row[0] == file_hash:
+                signatures[key] = [file_hash, None]
+                continue
+            with open(path) as f:
+                signatures[key] = [file_hash, signature(tokenize(f.read())) or []]
+    finally:
+        db.close()
+    return signatures
+
+
+def __estimate(sig, other):
+    return sum(1 for x, y in zip(sig, other) if x == y) / NUM_PERMUTATIONS
+
+
+def index_signatures(results):
+    """
+    Adds the new signatures computed by similarity to the index, in one transaction.
+    :param results: list of dicts, as returned by similarity
+    :return: list of strings, the keys of every module in the results
+    """
+    db = open_index()
+    try:
+        keys = []
+        with db:
+            for signatures in results:
+                for key, (file_hash, sig) in signatures.items():
+                    keys.append(key)
+                    if sig is None:
+                        continue
+                    db.execute('DELETE FROM buckets WHERE key = ?', (key,))
+                    db.execute('INSERT OR REPLACE INTO signatures VALUES (?, ?, ?)',
+                               (key, file_hash, ','.join(map(str, sig))))
+                    if len(sig) == 0:
+                        continue
+                    db.executemany('INSERT INTO buckets VALUES (?, ?, ?)',
+                                   [(band, bucket, key) for band, bucket in __bands(sig)])
+    finally:
+        db.close()
+    return keys
+
+
+def report_similar(results, threshold=SIMILARITY_THRESHOLD):
+    """
+    Adds new signatures to the index, then finds the modules of this homework that are similar to any indexed module,
+    of this or earlier homeworks and semesters. Only modules that share an LSH bucket are compared.
+    :param results: list of dicts, as returned by similarity
+    :param threshold: float, minimum estimated Jaccard similarity of the token shingles
+    :return: list of (similarity, key, other key)
+    """
+    keys = index_signatures(results)
+    db = open_index()
+    try:
+        pairs = {}
+        for key in keys:
+            row = db.execute('SELECT signature FROM signatures WHERE key = ?', (key,)).fetchone()
+            if row is None or row[0] == '':
+                continue
+            sig = [int(x) for x in row[0].split(',')]
+            candidates = db.execute('''
+                SELECT DISTINCT s.key, s.signature FROM buckets AS mine
+                JOIN buckets AS other ON other.band = mine.band AND other.bucket = mine.bucket AND other.key != mine.key
+                JOIN signatures AS s ON s.key = other.key
+                WHERE mine.key = ?''', (key,)).fetchall()
+            for other_key, other_sig in candidates:
+                # Both sides of a pair from one student are the same repository
+                if other_key.rsplit('/', 1)[0] == key.rsplit('/', 1)[0]:
+                    continue
+                estimate = __estimate(sig, [int(x) for x in other_sig.split(',')])
+                if estimate >= threshold:
+                    pairs[tuple(sorted([key, other_key]))] = estimate
+    finally:
+        db.close()
+
+    ranked = sorted(((estimate, key, other_key) for (key, other_key), estimate in pairs.items()), reverse=True)
+    print("> {0} similar pairs at or above {1}".format(len(ranked), threshold))
+    for estimate, key, other_key in ranked:
+        print("  {0:.2f}  {1}  {2}".format(estimate, key, other_key))
+    with open(SIMILARITY_REPORT, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['similarity', 'module', 'other_module'])
+        writer.writerows(ranked)
+    print('> Report saved to', SIMILARITY_REPORT)
+    return ranked
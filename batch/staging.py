@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+import json
+import shutil
+import time
+from . import metrics
+from .constants import *
+from .digest import digest
+
+# Lists what is staged in a directory, so the next staging only does what changed
+STAGING_MANIFEST = '.staging.json'
+TMP_PREFIX = '.staging-'
+
+
+def __load_manifest(target_dir):
+    try:
+        with open(os.path.join(target_dir, STAGING_MANIFEST)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def __save_manifest(target_dir, staged):
+    __write(json.dumps(staged), os.path.join(target_dir, STAGING_MANIFEST))
+
+
+def __source_key(path):
+    """
+    Identifies a version of a source file without reading it.
+    """
+    st = os.stat(path)
+    return "{0}:{1}:{2}:{3}".format(os.path.realpath(path), st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def staged_sources(target_dir):
+    """
+    Finds the source file behind each file last staged into a directory; generated files have none.
+    :param target_dir: string
+    :return: dict, path relative to target_dir -> source file path
+    """
+    sources = {}
+    for name, key in __load_manifest(target_dir).items():
+        # Keys of staged files are '<rewrite key>:' followed by their __source_key
+        if key is not None and not key.startswith('text:'):
+            sources[name] = key.split(':', 1)[1].rsplit(':', 3)[0]
+    return sources
+
+
+def __tmp_path(path):
+    """
+    Where a file is prepared before it is moved into place; a leftover of an interrupted staging is replaced.
+    """
+    tmp_path = os.path.join(os.path.dirname(path), "{0}{1}".format(TMP_PREFIX, os.path.basename(path)))
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+    return tmp_path
+
+
+def __link(source, path):
+    """
+    Puts a source file at path without copying it if possible: a hard link, else a symbolic link, else a copy.
+    The file appears atomically, so an interrupted staging never leaves a partial file behind.
+    """
+    tmp_path = __tmp_path(path)
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        try:
+            os.symlink(os.path.abspath(source), tmp_path)
+        except OSError:
+            shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def __write(text, path):
+    """
+    Writes a new file at path atomically. Never writes into an existing file, which may be linked to a source.
+    """
+    tmp_path = __tmp_path(path)
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def __remove(target_dir, name):
+    path = os.path.join(target_dir, name)
+    if os.path.lexists(path):
+        os.remove(path)
+    # Remove directories that only held staged files
+    directory = os.path.dirname(name)
+    while len(directory) > 0 and os.path.isdir(os.path.join(target_dir, directory)) and \
+            len(os.listdir(os.path.join(target_dir, directory))) == 0:
+        os.rmdir(os.path.join(target_dir, directory))
+        directory = os.path.dirname(directory)
+
+
+def stage(target_dir, files, rewrite=None, rewrite_key='', generated=None):
+    """
+    Makes target_dir hold the given files, doing only the work that changed since the last staging.
+    Untouched files are linked rather than copied; only rewritten and generated files are written.
+    Files staged last time that are not given any more are removed.
+    :param target_dir: string
+    :param files: dict, path relative to target_dir -> source file path
+    :param rewrite: function(relative path, source text) -> string, or None to link the file as is
+    :param rewrite_key: string, changes whenever rewrite would rewrite differently
+    :param generated: dict, path relative to target_dir -> text
+    :return: int, number of files written or linked
+    """
+    generated = generated or {}
+    # Identify everything first, so a missing source fails before anything is touched
+    keys = {name: "{0}:{1}".format(rewrite_key if rewrite is not None else 'link', __source_key(source))
+            for name, source in files.items()}
+    keys.update({name: 'text:' + digest(text) for name, text in generated.items()})
+
+    staged = __load_manifest(target_dir)
+    # Mark what is about to change first, so a crash in the middle is cleaned up by the next staging
+    changed = [name for name in keys if staged.get(name) != keys[name] or
+               not os.path.lexists(os.path.join(target_dir, name))]
+    removed = [name for name in staged if name not in keys]
+    if len(changed) == 0 and len(removed) == 0:
+        return 0
+    pending = dict(staged)
+    pending.update({name: None for name in changed})
+    __save_manifest(target_dir, pending)
+
+    copy_time, rewrite_time = 0.0, 0.0
+    for name in removed:
+        __remove(target_dir, name)
+    for name in changed:
+        path = os.path.join(target_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        start = time.perf_counter()
+        if name in generated:
+            __write(generated[name], path)
+            rewrite_time += time.perf_counter() - start
+            continue
+        text = None
+        if rewrite is not None:
+            with open(files[name]) as f:
+                text = rewrite(name, f.read())
+        if text is None:
+            __link(files[name], path)
+            copy_time += time.perf_counter() - start
+        else:
+            __write(text, path)
+            rewrite_time += time.perf_counter() - start
+
+    __save_manifest(target_dir, keys)
+    metrics.record('copy', copy_time)
+    metrics.record('expose', rewrite_time)
+    return len(changed)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+import csv
+import shutil
+import tempfile
+from .constants import *
+
+# Actions that read a CSV summary as a DataFrame; all others only read and write cells through Context
+PANDAS_ACTIONS = ['collect-votes']
+
+
+def parse_cell(text):
+    """
+    Reads a cell as pandas would: a number if it looks like one, None if empty.
+    :param text: string
+    :return: int, float, string or None
+    """
+    if text == '':
+        return None
+    for number in (int, float):
+        try:
+            return number(text)
+        except ValueError:
+            pass
+    return text
+
+
+class CsvSummary(object):
+    """
+    The class summary as plain rows, for actions that only get and set cells.
+    Supports the part of the DataFrame interface that Context and batch.py use, and loads without pandas.
+    Cells that are not set are written back exactly as they were read.
+    """
+    def __init__(self, path):
+        """
+        :param path: string, CSV file with a header row
+        """
+        super(CsvSummary, self).__init__()
+        with open(path, newline='') as f:
+            reader = csv.reader(f)
+            self.columns = next(reader, [])
+            self.rows = [dict(zip(self.columns, row)) for row in reader]
+        self.at = _Cells(self)
+
+    @property
+    def index(self):
+        return range(len(self.rows))
+
+    def __contains__(self, column):
+        return column in self.columns
+
+    def __getitem__(self, column):
+        """
+        :param column: string
+        :return: list, the values of a column
+        """
+        return [parse_cell(row.get(column, '')) for row in self.rows]
+
+    def __setitem__(self, column, value):
+        """
+        Sets a whole column to one value, creating it if needed.
+        """
+        if column not in self.columns:
+            self.columns.append(column)
+        for row in self.rows:
+            row[column] = value
+
+    def to_csv(self, path, index=False):
+        """
+        Writes the summary atomically; called like DataFrame.to_csv.
+        :param path: string
+        :param index: unused, rows have no index column
+        :return: None
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.')
+        with os.fdopen(fd, 'w', newline='') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerow(self.columns)
+            for row in self.rows:
+                writer.writerow(['' if row.get(column) is None else row[column] for column in self.columns])
+        if os.path.exists(path):
+            shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+
+
+class _Cells(object):
+    """Cell access by row and column, like DataFrame.at."""
+    def __init__(self, summary):
+        super(_Cells, self).__init__()
+        self.summary = summary
+
+    def __getitem__(self, key):
+        row, column = key
+        value = self.summary.rows[row].get(column, '')
+        return parse_cell(value) if isinstance(value, str) else value
+
+    def __setitem__(self, key, value):
+        row, column = key
+        self.summary.rows[row][column] = value
+
+
+def load_summary(action, path=CLASS_SUMMARY):
+    """
+    Reads the class summary: from the gradebook if there is one, else from the CSV file,
+    with pandas only for the actions that need a DataFrame.
+    :param action: string
+    :param path: string
+    :return: Gradebook, CsvSummary or pandas DataFrame
+    """
+    if os.path.exists(GRADEBOOK_PATH):
+        from .gradebook import Gradebook
+        return Gradebook()
+    if action in PANDAS_ACTIONS:
+        import pandas as pd
+        return pd.read_csv(path)
+    return CsvSummary(path)
+
+
+def save_summary(summary, path=CLASS_SUMMARY):
+    """
+    Writes the class summary back to the CSV file; the gradebook already holds every change.
+    :param summary: Gradebook, CsvSummary or pandas DataFrame
+    :param path: string
+    :return: None
+    """
+    summary.to_csv(path, index=False)
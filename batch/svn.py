@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+import subprocess
+import time
+import xml.etree.ElementTree as ElementTree
+from . import metrics
+from .constants import *
+
+# Errors worth retrying: network failures, server hiccups and working copy locks left by an interrupted command
+TRANSIENT_ERRORS = [
+    'E000104',  # connection reset
+    'E000110',  # connection timed out
+    'E000111',  # connection refused
+    'E155004',  # working copy locked
+    'E170013',  # unable to connect
+    'E175002',  # connection failure
+    'E175012',  # connection timed out
+    'E670008',  # name resolution failure
+]
+FAILED = 'failed'
+
+
+class SvnError(Exception):
+    pass
+
+
+def svn(args, cwd, retries=SVN_RETRIES, backoff=SVN_BACKOFF):
+    """
+    Runs an svn command, retrying transient failures with exponential backoff.
+    :param args: list, svn arguments
+    :param cwd: string, working directory
+    :param retries: int, number of retries after the first attempt
+    :param backoff: float, seconds to wait before the first retry
+    :return: string, standard output
+    """
+    for attempt in range(retries + 1):
+        with metrics.timed("svn {0}".format(args[0])):
+            proc = subprocess.run(['svn', '--non-interactive'] + args, cwd=cwd, stdout=subprocess.PIPE,
+                                  stderr=subprocess.PIPE, universal_newlines=True)
+        if proc.returncode == 0:
+            return proc.stdout
+        error = proc.stderr.strip()
+        if attempt == retries or not any(code in error for code in TRANSIENT_ERRORS):
+            raise SvnError(error)
+        if 'E155004' in error:
+            subprocess.run(['svn', 'cleanup'], cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        print("> svn {0} failed in {1}, retrying: {2}".format(args[0], cwd, error.splitlines()[-1]))
+        time.sleep(backoff * 2 ** attempt)
+
+
+def head_revisions(repo_names, url_prefix, chunk_size=SVN_INFO_CHUNK):
+    """
+    Asks the server for the latest revision of many repositories at once, with one `svn info` per chunk of them.
+    :param repo_names: list of strings
+    :param url_prefix: string, URL of the directory holding the repositories
+    :param chunk_size: int, repositories per svn call
+    :return: dict, repository name -> revision; repositories the server did not answer for are left out
+    """
+    revisions = {}
+    for i in range(0, len(repo_names), chunk_size):
+        urls = [os.path.join(url_prefix, repo_name) for repo_name in repo_names[i:i + chunk_size]]
+        with metrics.timed('svn info'):
+            proc = subprocess.run(['svn', '--non-interactive', 'info', '--xml'] + urls, stdout=subprocess.PIPE,
+                                  stderr=subprocess.PIPE, universal_newlines=True)
+        # Missing repositories only fail their own entry; the others are still listed
+        try:
+            entries = ElementTree.fromstring(proc.stdout).iter('entry')
+            for entry in entries:
+                repo_name = entry.findtext('url').rstrip('/').rsplit('/', 1)[-1]
+                revisions[repo_name] = int(entry.get('revision'))
+        except ElementTree.ParseError:
+            print("> Cannot read the latest revisions, pulling every repository: {0}".format(proc.stderr.strip()))
+    return revisions
+
+
+def print_summary(repo_names, statuses):
+    """
+    Prints the outcome of an svn action for each repository.
+    :param repo_names: list of strings
+    :param statuses: list of strings, as returned by the action
+    :return: None
+    """
+    failed = [repo for repo, status in zip(repo_names, statuses) if status == FAILED]
+    print('> Summary:')
+    for repo, status in zip(repo_names, statuses):
+        print("  {0}: {1}".format(repo, status))
+    print("> {0} succeeded, {1} failed".format(len(repo_names) - len(failed), len(failed)))
+    if len(failed) > 0:
+        print('> Failed:', ' '.join(failed))
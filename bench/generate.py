@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+import argparse
+import csv
+import random
+import shutil
+import subprocess
+from batch.constants import *
+
+STUDENT_NAME = 'student{0:03d}'
+SVN_DIR = 'svn'
+VOTING_FILE_PATH = os.path.join('voting', 'hw2-votes.txt')
+ALIAS_COLUMN = 'hw2_alias'
+COLLECTED_FILES = {
+    'Pi.html': '<html><body>Pi</body></html>\n',
+    'ThumbPi.png': 'placeholder\n',
+}
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULE_TEMPLATE = '''module {module} exposing (..)
+
+
+{functions}
+'''
+FUNCTION_TEMPLATE = '''f{i} : Int -> Int
+f{i} x =
+    x * {a} + {b}
+'''
+TESTS_TEMPLATE = '''module Tests exposing (..)
+
+import Test exposing (..)
+import Expect
+{imports}
+
+
+all : Test
+all =
+    describe "{name}" [
+{suites}
+    ]
+'''
+SUITE_TEMPLATE = '''        describe "Suite {i}" [
+{tests}
+        ]'''
+TEST_TEMPLATE = '''            test "Test {i}.{j} @{points}" <|
+                \\() -> Expect.equal {i} {i}'''
+
+
+def rebase(path, base_dir):
+    """
+    Moves a path of batch.constants under another base directory.
+    :param path: string, a path under BASE_DIR
+    :param base_dir: string
+    :return: string
+    """
+    return os.path.join(base_dir, os.path.relpath(path, BASE_DIR))
+
+
+def has_svn():
+    """
+    :return: bool, whether the svn command line tools are installed
+    """
+    return shutil.which('svn') is not None and shutil.which('svnadmin') is not None
+
+
+def tests_source(n_suites, n_tests, points):
+    """
+    Generates an Elm tests file.
+    :param n_suites: int
+    :param n_tests: int, tests per suite
+    :param points: list of numbers, point weights given to the tests in turn
+    :return: string
+    """
+    suites = []
+    for i in range(n_suites):
+        tests = [TEST_TEMPLATE.format(i=i + 1, j=j + 1, points=points[(i * n_tests + j) % len(points)])
+                 for j in range(n_tests)]
+        suites.append(SUITE_TEMPLATE.format(i=i + 1, tests='\n          , '.join(tests)))
+    imports = '\n'.join("import {0}".format(filename[:-4]) for filename in HW_FILES + SOLUTION_FILES)
+    return TESTS_TEMPLATE.format(name=HW_IDENTIFIER, imports=imports, suites='\n      , '.join(suites))
+
+
+def module_source(module, n_functions, rng):
+    """
+    Generates an Elm module with some arbitrary functions.
+    """
+    functions = '\n\n'.join(FUNCTION_TEMPLATE.format(i=i, a=rng.randint(1, 9), b=rng.randint(0, 99))
+                            for i in range(n_functions))
+    return MODULE_TEMPLATE.format(module=module, functions=functions)
+
+
+def __svn(args, cwd):
+    subprocess.run(['svn', '--non-interactive', '--quiet'] + args, cwd=cwd, check=True)
+
+
+def generate_class(base_dir, n_repos=30, n_suites=4, n_tests=5, points=(1, 2, 3), n_functions=20,
+                   missing_rate=0.05, seed=0, use_svn=True):
+    """
+    Generates a synthetic class under base_dir, laid out like BASE_DIR: one repository per student,
+    the class summary, the homework's tests and solutions, an elm-tester project and the make files.
+    With use_svn, every repository is a working copy of its own local svn repository under base_dir/svn.
+    :param base_dir: string, an empty or non-existent directory
+    :param n_repos: int
+    :param n_suites: int
+    :param n_tests: int, tests per suite
+    :param points: list of numbers, point weights given to the tests in turn
+    :param n_functions: int, size of every student module
+    :param missing_rate: float, chance that a student did not submit a file
+    :param seed: int, the same seed generates the same class
+    :param use_svn: bool
+    :return: list of strings, the repository names
+    """
+    rng = random.Random(seed)
+    base_dir = os.path.abspath(base_dir)
+    repos_dir = rebase(REPOS_DIR, base_dir)
+    tests_dir = os.path.join(rebase(TESTS_DIR, base_dir), HW_DIR)
+    os.makedirs(repos_dir, exist_ok=True)
+    os.makedirs(os.path.join(tests_dir, 'solution'), exist_ok=True)
+
+    # Tests and solutions
+    with open(os.path.join(tests_dir, TESTS_FILENAME), 'w') as f:
+        f.write(tests_source(n_suites, n_tests, list(points)))
+    for filename in SOLUTION_FILES:
+        with open(os.path.join(tests_dir, 'solution', filename), 'w') as f:
+            f.write(module_source(filename[:-4], n_functions, rng))
+
+    # Elm projects
+    shutil.copytree(os.path.join(REPO_ROOT, 'elm-tester'), os.path.join(base_dir, 'elm-tester'), dirs_exist_ok=True)
+    files_dir = rebase(FILES_DIR, base_dir)
+    os.makedirs(files_dir, exist_ok=True)
+    shutil.copy(os.path.join(REPO_ROOT, 'files', 'elm-package.json'), files_dir)
+
+    # Repositories
+    repo_names = [STUDENT_NAME.format(i) for i in range(n_repos)]
+    aliases = rng.sample(ALIAS_POOL, n_repos)
+    for repo_name in repo_names:
+        repo_path = os.path.join(repos_dir, repo_name)
+        if use_svn:
+            svn_path = os.path.join(base_dir, SVN_DIR, repo_name)
+            os.makedirs(os.path.dirname(svn_path), exist_ok=True)
+            subprocess.run(['svnadmin', 'create', svn_path], check=True)
+            __svn(['checkout', 'file://' + svn_path, repo_path], base_dir)
+        hw_path = os.path.join(repo_path, HW_DIR)
+        os.makedirs(hw_path, exist_ok=True)
+        for filename in HW_FILES:
+            if rng.random() >= missing_rate:
+                with open(os.path.join(hw_path, filename), 'w') as f:
+                    f.write(module_source(filename[:-4], n_functions, rng))
+        for filename, content in COLLECTED_FILES.items():
+            with open(os.path.join(hw_path, filename), 'w') as f:
+                f.write(content)
+        os.makedirs(os.path.join(repo_path, 'voting'), exist_ok=True)
+        with open(os.path.join(repo_path, VOTING_FILE_PATH), 'w') as f:
+            f.write('\n'.join(rng.sample(aliases, min(len(aliases), 3))) + '\n')
+        if use_svn:
+            __svn(['add', '--force', '.'], repo_path)
+            __svn(['commit', '-m', 'Submit ' + HW_DIR], repo_path)
+
+    # Class summary
+    class_summary = rebase(CLASS_SUMMARY, base_dir)
+    os.makedirs(os.path.dirname(class_summary), exist_ok=True)
+    with open(class_summary, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Repo', 'Late_Chips_Left', HW_DIR, HW_DIR + '_reason', ALIAS_COLUMN])
+        for repo_name, alias in zip(repo_names, aliases):
+            writer.writerow([repo_name, 5, '', '', alias])
+    return repo_names
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic class to benchmark batch.py against.')
+    parser.add_argument('base_dir', help='directory to generate the class in, used as GRADER_BASE_DIR')
+    parser.add_argument('-n', '--repos', type=int, default=30, help='number of repositories')
+    parser.add_argument('--suites', type=int, default=4, help='number of test suites')
+    parser.add_argument('--tests', type=int, default=5, help='number of tests per suite')
+    parser.add_argument('--points', default='1,2,3', help='comma-separated point weights given to the tests in turn')
+    parser.add_argument('--functions', type=int, default=20, help='number of functions per student module')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('--no-svn', action='store_true', help='plain directories instead of svn working copies')
+    args = parser.parse_args()
+    use_svn = not args.no_svn and has_svn()
+    if not args.no_svn and not use_svn:
+        print('> svn is not installed, generating plain directories')
+    repo_names = generate_class(args.base_dir, args.repos, args.suites, args.tests,
+                                args.points.split(','), args.functions, seed=args.seed,
+                                use_svn=use_svn)
+    print("> Generated {0} repositories in {1}".format(len(repo_names), os.path.abspath(args.base_dir)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from bench.generate import generate_class, has_svn, REPO_ROOT, SVN_DIR
+from bench.toolchain import DEFAULT_SETTINGS
+from batch.constants import *
+
+BIN_DIR = os.path.join(REPO_ROOT, 'bench', 'bin')
+BATCH_SCRIPT = os.path.join(REPO_ROOT, 'batch.py')
+
+# Every action of batch.py's DISPATCH, in an order where each finds what the previous ones left behind
+ACTIONS = ['pull', 'late-chip', 'grade', 'rescore', 'generate-rubric', 'make', 'collect', 'collect-votes',
+           'similarity', 'push', 'pipeline']
+SVN_ACTIONS = ['pull', 'late-chip', 'push', 'pipeline']
+# Actions benchmarked with -j when --jobs is given
+JOBS_ACTIONS = ['grade', 'pull', 'push']
+
+
+def action_args(action, base_dir, args):
+    """
+    :return: list of strings, the batch.py arguments to benchmark an action with
+    """
+    argv = [action]
+    if action == 'grade':
+        argv += ['-f', '-t', str(args.timeout)]  # measure grading, not the result cache
+        if args.batch_size > 1:
+            argv += ['-b', str(args.batch_size)]
+    elif action == 'pull':
+        argv += ['--svn-url', 'file://' + os.path.join(base_dir, SVN_DIR) + '/']
+    if args.jobs > 1 and action in JOBS_ACTIONS:
+        argv += ['-j', str(args.jobs)]
+    return argv
+
+
+def run_action(action, base_dir, args, run):
+    """
+    Runs batch.py once with the stand-in toolchain.
+    :return: dict, the wall-clock time, exit code and phase totals of the run
+    """
+    log_dir = os.path.join(base_dir, 'bench')
+    os.makedirs(log_dir, exist_ok=True)
+    metrics_path = os.path.join(log_dir, "{0}-{1}.jsonl".format(action, run))
+    env = dict(os.environ, GRADER_BASE_DIR=base_dir, GRADER_ELM_TESTER_DIR=os.path.join(base_dir, 'elm-tester'),
+               PATH=BIN_DIR + os.pathsep + os.environ['PATH'])
+    argv = [sys.executable, BATCH_SCRIPT] + action_args(action, base_dir, args) + ['-m', metrics_path]
+    with open(os.path.join(log_dir, "{0}-{1}.log".format(action, run)), 'w') as log:
+        start = time.perf_counter()
+        proc = subprocess.run(argv, cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+        seconds = time.perf_counter() - start
+
+    phases = {}
+    if os.path.exists(metrics_path):
+        with open(metrics_path) as f:
+            for line in f:
+                entry = json.loads(line)
+                if entry['phase'] not in ('repo', 'action'):
+                    phases[entry['phase']] = phases.get(entry['phase'], 0.0) + entry['seconds']
+    return {'seconds': seconds, 'returncode': proc.returncode, 'phases': phases}
+
+
+def benchmark(args):
+    """
+    Generates a synthetic class and runs every action on it.
+    :return: dict, the benchmark configuration and results
+    """
+    use_svn = has_svn() and not args.no_svn
+    if not use_svn:
+        print("> svn is not available, skipping {0}".format(', '.join(SVN_ACTIONS)))
+    actions = [action for action in ACTIONS if action in args.actions and (use_svn or action not in SVN_ACTIONS)]
+    settings = {name: float(os.environ.get(name, value)) for name, value in DEFAULT_SETTINGS.items()}
+
+    base_dir = tempfile.mkdtemp(prefix='grader-bench-') if args.dir is None else os.path.abspath(args.dir)
+    try:
+        print("> Generating {0} repositories in {1}".format(args.repos, base_dir))
+        generate_class(base_dir, args.repos, args.suites, args.tests, args.points.split(','), seed=args.seed,
+                       use_svn=use_svn)
+        results = {}
+        for action in actions:
+            runs = []
+            for run in range(args.repeat):
+                runs.append(run_action(action, base_dir, args, run))
+                print("> {0} #{1}: {2:.3f}s{3}".format(action, run + 1, runs[-1]['seconds'],
+                                                       '' if runs[-1]['returncode'] == 0 else ' (failed)'))
+            median = sorted(runs, key=lambda r: r['seconds'])[len(runs) // 2]
+            results[action] = {
+                'median': median['seconds'],
+                'min': min(r['seconds'] for r in runs),
+                'runs': [r['seconds'] for r in runs],
+                'failed': sum(1 for r in runs if r['returncode'] != 0),
+                'phases': median['phases'],
+            }
+    finally:
+        if args.dir is None and not args.keep:
+            shutil.rmtree(base_dir)
+        elif args.keep:
+            print('> Kept the synthetic class in', base_dir)
+
+    return {
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'config': {'repos': args.repos, 'suites': args.suites, 'tests': args.tests, 'points': args.points,
+                   'seed': args.seed, 'jobs': args.jobs, 'batch_size': args.batch_size, 'repeat': args.repeat,
+                   'settings': settings},
+        'results': results,
+    }
+
+
+def print_results(report, baseline=None):
+    """
+    Prints the median time of every action, compared to a baseline report if given.
+    :param report: dict, as returned by benchmark
+    :param baseline: dict, an earlier report, or None
+    :return: None
+    """
+    print("  {0:<16}{1:>10}{2:>10}{3:>10}{4:>9}".format('action', 'median', 'min', 'baseline', 'change'))
+    for action, result in report['results'].items():
+        line = "  {0:<16}{1:>10.3f}{2:>10.3f}".format(action, result['median'], result['min'])
+        if baseline is not None and action in baseline['results']:
+            before = baseline['results'][action]['median']
+            line += "{0:>10.3f}{1:>+8.1f}%".format(before, (result['median'] - before) / before * 100)
+        if result['failed'] > 0:
+            line += "  ({0} failed runs)".format(result['failed'])
+        print(line)
+    if baseline is not None and baseline['config'] != report['config']:
+        print('> Warning: the baseline was run with a different configuration')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark batch.py actions on a synthetic class.')
+    parser.add_argument('-a', '--actions', default=','.join(ACTIONS), help='comma-separated actions to run')
+    parser.add_argument('-b', '--batch-size', type=int, default=1, help='passed to grade')
+    parser.add_argument('-c', '--compare', help='earlier results file to compare with')
+    parser.add_argument('-d', '--dir', help='generate the class here instead of a temporary directory')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='passed to the actions that run in parallel')
+    parser.add_argument('-k', '--keep', action='store_true', help='keep the temporary directory')
+    parser.add_argument('-n', '--repos', type=int, default=30, help='number of repositories')
+    parser.add_argument('-o', '--output', help='file to save the results to, as JSON')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='runs per action')
+    parser.add_argument('-t', '--timeout', type=float, default=10, help='grade timeout per submission in seconds')
+    parser.add_argument('--suites', type=int, default=4, help='number of test suites')
+    parser.add_argument('--tests', type=int, default=5, help='number of tests per suite')
+    parser.add_argument('--points', default='1,2,3', help='comma-separated point weights given to the tests in turn')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the synthetic class')
+    parser.add_argument('--no-svn', action='store_true', help='skip the svn actions')
+    args = parser.parse_args()
+    args.actions = args.actions.split(',')
+
+    report = benchmark(args)
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(report, baseline)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print('> Results saved to', args.output)
+
+
+if __name__ == '__main__':
+    main()
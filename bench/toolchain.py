@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import time
+from batch.build_cache import ARTIFACT_EXTENSIONS, artifacts_dir, find_modules
+from batch.constants import *
+from batch.staging import staged_sources
+
+# Behaviour of the stand-in elm-test and elm-make, overridden from the environment
+DEFAULT_SETTINGS = {
+    'BENCH_COMPILE_SECONDS': 0.05,
+    'BENCH_TEST_SECONDS': 0.002,
+    'BENCH_FAIL_RATE': 0.2,
+    'BENCH_BROKEN_RATE': 0.02,
+    'BENCH_HANG_RATE': 0.0,
+    'BENCH_INSTALL_SECONDS': 0.5,
+}
+
+
+def setting(name):
+    """
+    :param name: string, one of DEFAULT_SETTINGS
+    :return: float
+    """
+    return float(os.environ.get(name, DEFAULT_SETTINGS[name]))
+
+
+def __staged_sources(source_dir):
+    """
+    Finds the files the grader staged into a directory, as recorded in the staging manifest of the tests directory.
+    :param source_dir: string, the tests directory, or one SubmissionN namespace directory in it
+    :return: dict, file name -> path of the original file; empty if nothing was staged
+    """
+    for manifest_dir, prefix in [(source_dir, ''), (os.path.dirname(source_dir), os.path.basename(source_dir) + '/')]:
+        sources = {name[len(prefix):]: path for name, path in staged_sources(manifest_dir).items()
+                   if name.startswith(prefix) and '/' not in name[len(prefix):]}
+        if len(sources) > 0:
+            return sources
+    return {}
+
+
+def submission_seed(source_dir):
+    """
+    Identifies a submission by the Elm sources directly in a directory. Staged files are read from their originals,
+    so a submission is identified the same whether it was tested alone or under a namespace in a batch.
+    :param source_dir: string
+    :return: string
+    """
+    sources = __staged_sources(source_dir)
+    if len(sources) == 0:
+        sources = {filename: os.path.join(source_dir, filename) for filename in os.listdir(source_dir)}
+    sha = hashlib.sha256()
+    for filename in sorted(sources):
+        if filename.endswith('.elm'):
+            with open(sources[filename], 'rb') as f:
+                sha.update(filename.encode('utf-8') + b'\0' + f.read() + b'\0')
+    return sha.hexdigest()
+
+
+def chance(seed, *parts):
+    """
+    A deterministic random number for a submission and an event.
+    :param seed: string, as returned by submission_seed
+    :return: float in [0, 1)
+    """
+    sha = hashlib.sha256('\0'.join((seed,) + parts).encode('utf-8'))
+    return int(sha.hexdigest()[:8], 16) / 2 ** 32
+
+
+def compile_project(project_dir, source_dir):
+    """
+    Pretends to compile an Elm project the way elm-make does: only modules without an up-to-date build artifact
+    take time, and their artifacts are written so that the grader's build cache sees realistic files.
+    :param project_dir: string, directory containing elm-package.json
+    :param source_dir: string, directory containing the Elm modules
+    :return: int, number of modules compiled
+    """
+    target_dir = artifacts_dir(project_dir)
+    os.makedirs(target_dir, exist_ok=True)
+    compiled = 0
+    for module, path in find_modules(source_dir).items():
+        artifacts = [os.path.join(target_dir, module.replace('.', '-') + ext) for ext in ARTIFACT_EXTENSIONS]
+        source_time = os.path.getmtime(path)
+        if all(os.path.exists(artifact) and os.path.getmtime(artifact) >= source_time for artifact in artifacts):
+            continue
+        time.sleep(setting('BENCH_COMPILE_SECONDS'))
+        with open(path, 'rb') as f:
+            compiled_source = hashlib.sha256(f.read()).hexdigest()
+        for artifact in artifacts:
+            with open(artifact, 'w') as f:
+                f.write(compiled_source)
+        compiled += 1
+    return compiled
+
+
+def install_packages(project_dir):
+    """
+    Pretends to download the packages of an Elm project the way elm-package does, taking BENCH_INSTALL_SECONDS
+    per package, and lays them out under elm-stuff like elm-package 0.18.
+    :param project_dir: string, directory containing elm-package.json
+    :return: None
+    """
+    with open(os.path.join(project_dir, 'elm-package.json')) as f:
+        dependencies = json.load(f)['dependencies']
+    exact = {}
+    for package, constraint in dependencies.items():
+        time.sleep(setting('BENCH_INSTALL_SECONDS'))
+        exact[package] = constraint.split()[0]  # the lowest allowed version
+        package_dir = os.path.join(project_dir, 'elm-stuff', 'packages', package, exact[package])
+        os.makedirs(package_dir, exist_ok=True)
+        with open(os.path.join(package_dir, 'elm-package.json'), 'w') as f:
+            json.dump({'version': exact[package], 'dependencies': {}}, f)
+    with open(os.path.join(project_dir, 'elm-stuff', 'exact-dependencies.json'), 'w') as f:
+        json.dump(exact, f, indent=4)
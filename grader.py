@@ -2,12 +2,21 @@
 
 import argparse
 import json
-import shutil
+import re
+import resource
+import selectors
+import signal
 import subprocess
 import sys
+import tempfile
+import time
+from batch import daemon, metrics, staging
+from batch.build_cache import BuildCache
 from batch.constants import *
+from batch.digest import digest, file_digest
 
-ELM_CACHE_PATH = os.path.join(ELM_TESTER_DIR, 'tests/elm-stuff/build-artifacts/0.18.0/user')
+# Bump whenever a change to the grader can change scores or reports, so cached results are regraded
+GRADER_VERSION = '1.3'
 
 
 class BrokenTestsError(Exception):
@@ -18,32 +27,317 @@ class TestingFailureError(Exception):
     pass
 
 
-def decode_result(proc):
+class TestingTimeoutError(Exception):
+    pass
+
+
+MANIFEST_CACHE_DIR = os.path.join(CACHE_DIR, 'manifests')
+TOKEN_PATTERN = re.compile(r'''
+    (?P<comment>--[^\n]*|\{-.*?-\})
+  | (?P<string>"(?:\\.|[^"\\\n])*")
+  | (?P<char>'(?:\\.|[^'\\\n])')
+  | (?P<keyword>\b(?:describe|test)\b)
+  | (?P<name>(?<![\w.'])[a-z_][\w']*)
+  | (?P<open>[\[(])
+  | (?P<close>[\])])
+''', re.VERBOSE | re.DOTALL)
+# A top-level value or function: a lower-case name at the start of a line
+DECLARATION_PATTERN = re.compile(r"^[a-z_][\w']*", re.MULTILINE)
+# The suite elm-tester's Main.elm runs
+ROOT_SUITE = 'all'
+
+MODULE_HEADER_PATTERN = re.compile(r'^((?:port\s+|effect\s+)?module\s+)([\w.]+)', re.MULTILINE)
+BATCH_NAMESPACE = 'Submission{0}'
+BATCH_SUITE = 'Submissions'
+BATCH_TESTS_TEMPLATE = '''module Tests exposing (..)
+
+import Test exposing (..)
+{imports}
+
+
+all : Test
+all =
+    describe "{suite}"
+        [ {suites}
+        ]
+'''
+
+# Manifests loaded by this process, by key
+_manifests = {}
+
+# Longest elm-test output line we are willing to buffer
+MAX_EVENT_BYTES = 1 << 20
+
+
+def __limit_resources(cpu_limit, memory_limit):
+    """
+    Returns a function that applies resource limits in the test process before it starts.
+    :param cpu_limit: int, CPU seconds, or None
+    :param memory_limit: int, megabytes of address space, or None
+    :return: function
+    """
+    def apply_limits():
+        if cpu_limit is not None:
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu_limit, cpu_limit))
+        if memory_limit is not None:
+            limit = memory_limit * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    return apply_limits
+
+
+def decode_event(line):
+    """
+    Parses one line of elm-test JSON output into a Python object.
+    :param line: bytes
+    :return: dict, or None for lines that are not events
+    """
+    line = line.strip()
+    if len(line) == 0:
+        return None
+    try:
+        return json.loads(line.decode('utf-8'))
+    except ValueError:
+        return None
+
+
+def load_events(log_path):
     """
-    Parses the testing result into a Python object.
-    :param proc: CompletedProcess
-    :return: a list of dictionaries
+    Reads test events saved by save_events.
+    :param log_path: string
+    :return: list of dictionaries
     """
-    lines = proc.stdout.decode('utf-8').split('\n')
+    with open(log_path, 'rb') as f:
+        return [event for event in map(decode_event, f) if event is not None]
+
+
+def save_events(events, log_path):
+    """
+    Saves test events as JSON lines, replacing any previous log atomically.
+    :param events: list of dictionaries
+    :param log_path: string
+    :return: None
+    """
+    log_dir = os.path.dirname(os.path.abspath(log_path))
+    os.makedirs(log_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=log_dir)
+    with os.fdopen(fd, 'w') as f:
+        for event in events:
+            f.write(json.dumps(event) + '\n')
+    os.replace(tmp_path, log_path)
+
+
+def run_tests(tester_dir, n_tests, timeout=None, cpu_limit=None, memory_limit=None):
+    """
+    Runs elm-test and consumes its JSON event stream as it arrives.
+    The test process is stopped as soon as n_tests tests have completed.
+    :param tester_dir: string, elm-tester project to run in
+    :param n_tests: int, expected number of tests
+    :param timeout: float, wall-clock limit in seconds, or None
+    :param cpu_limit: int, CPU seconds, or None
+    :param memory_limit: int, megabytes, or None
+    :return: list of dictionaries, the test events
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    limit_resources = None
+    if cpu_limit is not None or memory_limit is not None:
+        limit_resources = __limit_resources(cpu_limit, memory_limit)
+    start = time.perf_counter()
+    first_event = None  # elm-test only reports once everything has compiled
+    proc = subprocess.Popen(['elm-test', '--report', 'json'], cwd=tester_dir, stdout=subprocess.PIPE,
+                            start_new_session=True, preexec_fn=limit_resources)
     result = []
-    for line in lines:
-        if len(line) > 0:
-            result.append(json.loads(line))
+    n_completed = 0
+    buffer = b''
+    selector = selectors.DefaultSelector()
+    selector.register(proc.stdout, selectors.EVENT_READ)
+    try:
+        while n_completed < n_tests:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise TestingTimeoutError("Tests did not finish within {0} seconds".format(timeout))
+            if not selector.select(remaining):
+                continue
+            chunk = os.read(proc.stdout.fileno(), 1 << 16)
+            if len(chunk) == 0:
+                break  # elm-test exited
+            lines = (buffer + chunk).split(b'\n')
+            buffer = lines.pop()
+            if len(buffer) > MAX_EVENT_BYTES:
+                raise TestingFailureError('Test output line too long')
+            for line in lines:
+                event = decode_event(line)
+                if event is None:
+                    continue
+                if first_event is None:
+                    first_event = time.perf_counter()
+                result.append(event)
+                if event.get('event') == 'testCompleted':
+                    n_completed += 1
+        event = decode_event(buffer)
+        if event is not None:
+            result.append(event)
+    finally:
+        selector.close()
+        if proc.poll() is None:
+            os.killpg(proc.pid, signal.SIGKILL)
+        proc.wait()
+        proc.stdout.close()
+        end = time.perf_counter()
+        metrics.record('compile', (end if first_event is None else first_event) - start)
+        if first_event is not None:
+            metrics.record('test', end - first_event)
+
+    if proc.returncode == -signal.SIGXCPU and n_completed < n_tests:
+        raise TestingTimeoutError("Tests exceeded the CPU limit of {0} seconds".format(cpu_limit))
     return result
 
 
-def count_tests(tests_path):
+def __tokenize(source):
     """
-    Counts the number of tests in an Elm tests file.
-    :param tests_path: str
-    :return: int
+    Yields the tokens of an Elm tests file that matter for finding tests: string literals,
+    the describe and test keywords, lower-case names, and brackets. Comments and everything else are skipped.
+    :param source: string
+    :return: generator of (kind, text)
+    """
+    for match in TOKEN_PATTERN.finditer(source):
+        kind = match.lastgroup
+        if kind in ('comment', 'char'):
+            continue
+        text = match.group(kind)
+        if kind == 'string':
+            try:
+                text = json.loads(text)
+            except ValueError:
+                text = text[1:-1]  # an Elm escape JSON does not know
+        yield kind, text
+
+
+def __declarations(source):
+    """
+    Splits an Elm file into its top-level declarations.
+    :param source: string
+    :return: dict, name -> source of its type annotation and definition, without the name itself
+    """
+    # Blank out comments first, so that nothing inside them looks like a declaration
+    source = TOKEN_PATTERN.sub(lambda match: ' ' if match.lastgroup == 'comment' else match.group(0), source)
+    starts = list(DECLARATION_PATTERN.finditer(source))
+    declarations = {}
+    for i, match in enumerate(starts):
+        end = starts[i + 1].start() if i + 1 < len(starts) else len(source)
+        declarations[match.group(0)] = declarations.get(match.group(0), '') + source[match.end():end]
+    return declarations
+
+
+def __find_tests(source):
+    """
+    Finds every test that ROOT_SUITE of an Elm tests file runs, with its enclosing describe labels, at any depth.
+    Suites defined as their own top-level values are followed where they are referenced, so
+    `all = describe "HW" [ insertTests, deleteTests ]` lists the tests of insertTests and deleteTests under "HW".
+    :param source: string
+    :return: list of lists of strings, labels of each test from the outermost suite to the test name
+    """
+    declarations = __declarations(source)
+    found = {}
+
+    def walk(declaration, visiting):
+        if declaration in found:
+            return found[declaration]
+        tests = []
+        stack = []  # one entry per open bracket: the suite name, or None
+        keyword = None
+        pending_suite = None
+        for kind, text in __tokenize(declarations[declaration]):
+            if kind == 'keyword':
+                keyword = text
+                continue
+            if kind == 'string' and keyword == 'describe':
+                pending_suite = text
+            elif kind == 'string' and keyword == 'test':
+                tests.append([name for name in stack if name is not None] + [text])
+            elif kind == 'name' and text in declarations and text not in visiting:
+                prefix = [name for name in stack if name is not None]
+                tests += [prefix + labels for labels in walk(text, visiting | {text})]
+            elif kind == 'open':
+                stack.append(pending_suite if text == '[' else None)
+                pending_suite = None
+            elif kind == 'close' and len(stack) > 0:
+                stack.pop()
+            keyword = None
+        found[declaration] = tests
+        return tests
+
+    # Helpers and suites that ROOT_SUITE does not reach are never run
+    return walk(ROOT_SUITE, {ROOT_SUITE}) if ROOT_SUITE in declarations else []
+
+
+def __test_key(labels):
+    """
+    Identifies a test by its labels without its points, so that results stay valid when points change.
+    :param labels: list of strings
+    :return: tuple
+    """
+    return tuple(labels[:-1]) + (labels[-1].split('@')[0].strip(),)
+
+
+def build_manifest(tests_path):
+    """
+    Builds the manifest of an Elm tests file: its suites, tests and their points.
+    :param tests_path: string
+    :return: dict
     """
     with open(tests_path) as f:
-        ret = 0
-        for line in f.readlines():
-            if 'test "' in line:
-                ret += 1
-        return ret
+        source = f.read()
+    tests = []
+    seen = set()
+    for labels in __find_tests(source):
+        test_name_list = labels[-1].split('@')
+        if len(test_name_list) != 2:
+            raise BrokenTestsError("Invalid test name '{0}'; must include points".format(test_name_list[0]))
+        try:
+            points = intify(float(test_name_list[1]))
+        except ValueError:
+            raise BrokenTestsError("Invalid points in test name '{0}'".format(labels[-1]))
+        key = __test_key(labels)
+        if key in seen:
+            raise BrokenTestsError("Duplicate test '{0}'".format(' / '.join(key)))
+        seen.add(key)
+        tests.append({'labels': labels, 'suite': labels[1:-1], 'name': test_name_list[0].strip(), 'points': points})
+
+    if len(tests) == 0:
+        raise BrokenTestsError("No tests found in {0}".format(tests_path))
+    if len(set(test['labels'][0] for test in tests)) != 1 or len(tests[0]['labels']) < 2:
+        raise BrokenTestsError('All tests must be inside a single top-level describe')
+    return {
+        'digest': file_digest(tests_path),
+        'name': tests[0]['labels'][0],
+        'tests': tests,
+        'total': intify(float(sum(test['points'] for test in tests))),
+    }
+
+
+def load_manifest(tests_path, cache_dir=MANIFEST_CACHE_DIR):
+    """
+    Loads the manifest of an Elm tests file, building it only if the file changed since it was last built.
+    :param tests_path: string
+    :param cache_dir: string, directory of built manifests
+    :return: dict, as returned by build_manifest
+    """
+    key = digest(GRADER_VERSION, file_digest(tests_path))
+    if key in _manifests:
+        return _manifests[key]
+    manifest_path = os.path.join(cache_dir, key + '.json')
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        manifest = build_manifest(tests_path)
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, manifest_path)
+    _manifests[key] = manifest
+    return manifest
 
 
 def decode_status(event):
@@ -67,20 +361,29 @@ def intify(x):
     return x
 
 
-def generate_report(test_result, n_tests):
+def generate_report(test_result, manifest):
     """
     Generates a test report based on test result.
     :param test_result: list, test result
-    :param n_tests: int, expected number of tests
+    :param manifest: dict, as returned by load_manifest
     :return: (string, int), (report text, points)
     """
     # Pre-processing
     test_events = list(filter(lambda e: e['event'] == 'testCompleted', test_result))
+    n_tests = len(manifest['tests'])
 
     if len(test_events) != n_tests:
         raise TestingFailureError("Wrong number of test results; expecting {0}, got {1}".format(
             n_tests, len(test_events)))
 
+    # Match every result to its test in the manifest
+    statuses = {}
+    for event in test_events:
+        key = __test_key(event['labels'])
+        if key in statuses:
+            raise TestingFailureError("Duplicate result for test '{0}'".format(' / '.join(key)))
+        statuses[key] = decode_status(event)
+
     # Initialization
     report = []
     total = 0.0
@@ -100,18 +403,13 @@ def generate_report(test_result, n_tests):
             total += subtotal
             my_total += my_subtotal
 
-    # Iterate over test results
-    for event in test_events:
-        # TODO: support arbitrary test suite depth
-        # Extract test metadata
-        if len(event['labels']) != 3:
-            raise BrokenTestsError('Invalid test labels')
-        test_suite = event['labels'][1]
-        test_name_list = event['labels'][2].split('@')
-        if len(test_name_list) != 2:
-            raise BrokenTestsError("Invalid test name '{0}'; must include points".format(test_name_list[0]))
-        test = test_name_list[0].strip()
-        points = intify(float(test_name_list[1]))
+    # Iterate over the tests in the order they are defined
+    for test in manifest['tests']:
+        key = __test_key(test['labels'])
+        if key not in statuses:
+            raise TestingFailureError("Missing result for test '{0}'".format(' / '.join(key)))
+        test_suite = ' / '.join(test['suite']) if len(test['suite']) > 0 else manifest['name']
+        points = test['points']
 
         if test_suite != current_suite:
             conclude_suite()
@@ -124,17 +422,16 @@ def generate_report(test_result, n_tests):
             report.append('')
 
         # Handle current test
-        status = decode_status(event)
-        my_points = points if status else 0
+        my_points = points if statuses[key] else 0
         subtotal += points
         my_subtotal += my_points
-        report.append("  - Test Case {0}: {1} / {2}".format(test, my_points, points))
+        report.append("  - Test Case {0}: {1} / {2}".format(test['name'], my_points, points))
 
     # Conclude the last test suite
     conclude_suite()
 
     # Conclude the test report
-    report_name = test_events[0]['labels'][0]
+    report_name = manifest['name']
     report = ["{0} Total Score: {1} / {2}".format(report_name, intify(my_total), intify(total)), ''] + report
     report_text = '\n'.join(report)
     return report_text, my_total
@@ -142,80 +439,211 @@ def generate_report(test_result, n_tests):
 
 def grade(argv):
     """
-    Main routine.
+    Main routine. Uses the grading daemon if one is running, and grades in this process otherwise.
     :param argv: list, command line arguments
     :return: int, the grade
     """
+    args = __parse_args(argv)
+    result = None if args.local else daemon.request_grade(args)
+    if result is None:
+        result = grade_locally(args)
+    report, score = result
+
+    if args.output is not None:
+        print(args.output)
+        with open(args.output, 'w') as f:
+            print(report, file=f)
+    else:
+        print(report)
+    return score
+
+
+def __parse_args(argv):
     parser = argparse.ArgumentParser(description='Set up and run Elm automated testing.')
     parser.add_argument('test_dir', help='directory containing test files')
     parser.add_argument('-d', '--dependencies', nargs='*', help='dependent module file paths')
     parser.add_argument('-o', '--output', help='output file, default to stdout')
+    parser.add_argument('-l', '--log', help='file to save the raw test events to')
     parser.add_argument('-e', '--expose', action='store_true', help='force module files to expose everything')
+    parser.add_argument('-c', '--build-cache', default=BUILD_CACHE_DIR, help='directory of cached compiled modules')
+    parser.add_argument('-t', '--tester-dir', default=ELM_TESTER_DIR, help='elm-tester project to run the tests in')
     parser.add_argument('-v', '--verbose', action='store_true', help='verbose mode')
-    args = parser.parse_args(args=argv)
+    parser.add_argument('--timeout', type=float, default=TEST_TIMEOUT, help='wall-clock limit for the tests in seconds')
+    parser.add_argument('--cpu-limit', type=int, default=TEST_CPU_LIMIT, help='CPU limit for the tests in seconds')
+    parser.add_argument('--memory-limit', type=int, default=TEST_MEMORY_LIMIT, help='memory limit for the tests in MB')
+    parser.add_argument('--local', action='store_true', help='grade in this process even if the daemon is running')
+    return parser.parse_args(args=argv)
+
 
+def grade_locally(args):
+    """
+    Sets up and runs the tests in an elm-tester project.
+    :param args: parsed command line arguments
+    :return: (string, int), (report text, points)
+    """
     if args.verbose:
         print("Preparing to run test suite '{0}'...".format(args.test_dir))
 
-    if os.path.exists(ELM_CACHE_PATH):
-        shutil.rmtree(ELM_CACHE_PATH)
-    shutil.copy(os.path.join(args.test_dir, TESTS_FILENAME), os.path.join(ELM_TESTER_DIR, 'tests'))
-
-    copied_dependencies_path = []
-    if args.dependencies is not None:
-        for dep_path in args.dependencies:
-            dep_filename = os.path.basename(dep_path)
-            copied_dep_path = shutil.copy(dep_path, os.path.join(ELM_TESTER_DIR, 'tests'))
-            copied_dependencies_path.append(copied_dep_path)
-            if args.expose:
-                # Expose all Elm functions in module
-                with open(copied_dep_path) as f:
-                    lines = f.readlines()
-                    for i, line in enumerate(lines):
-                        if line.startswith('module '):
-                            lines[i] = "module {} exposing (..)".format(dep_filename[:-4])
-                            break
-                with open(copied_dep_path, 'w') as f:
-                    for line in lines:
-                        f.write(line)
+    # Link the tests and modules into the tester; files unchanged since the last run are left in place
+    tester_tests_dir = os.path.join(args.tester_dir, 'tests')
+    files = {TESTS_FILENAME: os.path.join(args.test_dir, TESTS_FILENAME)}
+    for dep_path in args.dependencies or []:
+        files[os.path.basename(dep_path)] = dep_path
+    rewrite = None
+    if args.expose:
+        # Expose all Elm functions in the student modules
+        def rewrite(filename, source):
+            return None if filename == TESTS_FILENAME else rename_module(source, filename[:-4], expose=True)
+    n_staged = staging.stage(tester_tests_dir, files, rewrite, 'expose')
+    if args.verbose:
+        print("Staged {0} of {1} files".format(n_staged, len(files)))
+
+    # Reuse compiled modules whose sources and imports are unchanged
+    build_cache = BuildCache(args.build_cache)
+    with metrics.timed('build-cache'):
+        build_cache.restore(tester_tests_dir, tester_tests_dir)
+    if args.verbose:
+        print("Build cache: {0} hits, {1} misses".format(build_cache.hits, build_cache.misses))
+
+    if args.verbose:
+        print('Analyzing tests...')
+    manifest = load_manifest(os.path.join(args.test_dir, TESTS_FILENAME))
+    n_tests = len(manifest['tests'])
 
     if args.verbose:
         print('Running tests...', end='')
+    result_json = run_tests(args.tester_dir, n_tests, args.timeout, args.cpu_limit, args.memory_limit)
+    with metrics.timed('build-cache'):
+        build_cache.store(tester_tests_dir)
+    if args.verbose:
+        print(' done.')
+    if args.log is not None:
+        save_events(result_json, args.log)
 
-    try:
-        # proc = subprocess.run(['elm-test'], cwd=ELM_TESTER_DIR)
-        proc = subprocess.run(['elm-test', '--report', 'json'], cwd=ELM_TESTER_DIR, stdout=subprocess.PIPE)
-        result_json = decode_result(proc)
-        if args.verbose:
-            print(' done.')
+    if args.verbose:
+        print('Generating report...')
+    with metrics.timed('report'):
+        report, score = generate_report(result_json, manifest)
 
-        if args.verbose:
-            print('Analyzing tests...')
-        n_tests = count_tests(os.path.join(ELM_TESTER_DIR, 'tests', TESTS_FILENAME))
+    return report, score
 
-        if args.verbose:
-            print('Generating report...')
 
-        try:
-            report, score = generate_report(result_json, n_tests)
-        finally:
-            if args.verbose:
-                print('Cleaning up...')
-            os.remove(os.path.join(ELM_TESTER_DIR, 'tests', TESTS_FILENAME))
-            for copied_dep_path in copied_dependencies_path:
-                os.remove(copied_dep_path)
-
-        if args.output is not None:
-            print(args.output)
-            with open(args.output, 'w') as f:
-                print(report, file=f)
-        else:
-            print(report)
-        return score
-
-    except IndexError:
-        print('Error: incomplete test result possibly due to crash')
-        return 0
+def rename_module(source, module_name, expose=False):
+    """
+    Rewrites the module declaration of an Elm source.
+    :param source: string
+    :param module_name: string, new module name
+    :param expose: bool, also make the module expose everything
+    :return: string
+    """
+    match = MODULE_HEADER_PATTERN.search(source)
+    if match is None:
+        return source
+    end = match.end()
+    if expose:
+        # Skip the old exposing list, which may span several lines
+        opening = source.find('(', end)
+        depth = 0
+        for i in range(opening, len(source)):
+            depth += {'(': 1, ')': -1}.get(source[i], 0)
+            if depth == 0:
+                end = i + 1
+                break
+        return source[:match.start()] + "{0}{1} exposing (..)".format(match.group(1), module_name) + source[end:]
+    return source[:match.start()] + match.group(1) + module_name + source[end:]
+
+
+def namespace_imports(source, namespace, modules):
+    """
+    Makes an Elm source import some modules from a namespace, aliased to their old names so references still work.
+    :param source: string
+    :param namespace: string
+    :param modules: list of strings, module names to move into the namespace
+    :return: string
+    """
+    for module in modules:
+        pattern = re.compile(r'^import\s+{0}(?=\s|$)(\s+as\s+\w+)?'.format(re.escape(module)), re.MULTILINE)
+        source = pattern.sub(lambda m: "import {0}.{1}{2}".format(
+            namespace, module, m.group(1) or " as {0}".format(module)), source)
+    return source
+
+
+def run_batch(test_dir, submissions, tester_dir=ELM_TESTER_DIR, build_cache_dir=BUILD_CACHE_DIR,
+              timeout=TEST_TIMEOUT, cpu_limit=TEST_CPU_LIMIT, memory_limit=TEST_MEMORY_LIMIT, expose=True,
+              verbose=False):
+    """
+    Runs the tests of several submissions in a single elm-test invocation, to pay the start-up cost once.
+    Each submission's modules and a copy of the tests are put under their own namespace,
+    and the resulting event stream is split back per submission.
+    :param test_dir: string, directory containing test files
+    :param submissions: list of (key, list of dependency paths)
+    :param tester_dir: string, elm-tester project to run the tests in
+    :param build_cache_dir: string, directory of cached compiled modules
+    :param timeout: float, wall-clock limit per submission in seconds, or None
+    :param cpu_limit: int, CPU seconds per submission, or None
+    :param memory_limit: int, megabytes, or None
+    :param expose: bool, force module files to expose everything
+    :param verbose: bool
+    :return: dict, key -> list of test events; None if the batch did not run to completion
+    """
+    tests_path = os.path.join(test_dir, TESTS_FILENAME)
+    manifest = load_manifest(tests_path)
+    tester_tests_dir = os.path.join(tester_dir, 'tests')
+
+    # Every submission gets its modules and a copy of the tests under its own namespace
+    namespaces = {}
+    namespace_modules = {}
+    files = {}
+    for i, (key, dependencies) in enumerate(submissions):
+        namespace = BATCH_NAMESPACE.format(i)
+        namespaces[namespace] = key
+        namespace_modules[namespace] = [os.path.basename(path)[:-4] for path in dependencies]
+        files[os.path.join(namespace, TESTS_FILENAME)] = tests_path
+        for path in dependencies:
+            files[os.path.join(namespace, os.path.basename(path))] = path
+
+    def rewrite(filename, source):
+        namespace, filename = os.path.split(filename)
+        module = filename[:-4]
+        source = rename_module(source, "{0}.{1}".format(namespace, module), expose and module != 'Tests')
+        return namespace_imports(source, namespace, namespace_modules[namespace])
+
+    suite = BATCH_TESTS_TEMPLATE.format(
+        suite=BATCH_SUITE,
+        imports='\n'.join("import {0}.Tests".format(namespace) for namespace in namespaces),
+        suites='\n        , '.join('describe "{0}" [ {0}.Tests.all ]'.format(namespace) for namespace in namespaces))
+    staging.stage(tester_tests_dir, files, rewrite, digest('batch', str(expose), json.dumps(namespace_modules)),
+                  {TESTS_FILENAME: suite})
+
+    build_cache = BuildCache(build_cache_dir)
+    with metrics.timed('build-cache'):
+        build_cache.restore(tester_tests_dir, tester_tests_dir)
+    if verbose:
+        print("Running tests of {0} submissions at once...".format(len(submissions)))
+        print("Build cache: {0} hits, {1} misses".format(build_cache.hits, build_cache.misses))
+
+    n_tests = len(manifest['tests']) * len(submissions)
+    try:
+        events = run_tests(tester_dir, n_tests, None if timeout is None else timeout * len(submissions),
+                           None if cpu_limit is None else cpu_limit * len(submissions), memory_limit)
+    except (TestingFailureError, TestingTimeoutError) as e:
+        print('Batch run failed:', e)
+        return None
+    with metrics.timed('build-cache'):
+        build_cache.store(tester_tests_dir)
+
+    # Split the events by submission and strip the batch labels
+    results = {key: [] for key in namespaces.values()}
+    for event in events:
+        if event.get('event') != 'testCompleted':
+            continue
+        labels = event['labels']
+        if len(labels) < 2 or labels[1] not in namespaces:
+            return None
+        results[namespaces[labels[1]]].append(dict(event, labels=labels[2:]))
+    if any(len(result) != len(manifest['tests']) for result in results.values()):
+        return None  # some submission did not compile or crashed
+    return results
 
 
 def main():
@@ -1,47 +1,115 @@
 #!/usr/bin/env python3
 
-from glob import glob
 import os
+import re
 from string import Template
 import subprocess
+try:
+    from PIL import Image
+except ImportError:
+    Image = None  # reported by main, so the page is never built from the full-size originals
 
 HTML_DIR = './html'
 SUBMISSIONS_DIR = './submissions'
+THUMBNAILS_DIR = './thumbnails'
 FOOTER_PATH = os.path.join(HTML_DIR, 'footer.html')
 HEADER_PATH = os.path.join(HTML_DIR, 'header.html')
 TEMPLATE_PATH = os.path.join(HTML_DIR, 'template.html')
+PLACEHOLDER_PATH = os.path.join(HTML_DIR, 'placeholder.svg')
 OUTPUT_PATH = 'index.html'
-SUBMISSIONS = ['18481', '77377', '91019', '76367', '15551', '19891', None, '98389', '37273', '74047', '30103', '94849', '94949', '78787', '79697', '96469', '38183', '93139', '95959', '96769', '30803', '74747', '96269', '36563', '16061', '94649', '70207', '17471', '35153', '71917', '13931', '11411', '93239', '14741', '73637', '13331', '97379', '76667', '19991', '31513', '97579', '73037', '37573', '10501', '30403', '13831', '11311']
+THUMBNAIL_PREFIX = 'ThumbPi.'
+THUMBNAIL_SIZE = (400, 400)  # shown at 200x200, kept sharp on high density screens
+SECTION_BEGIN = '<!-- submission {0} -->\n'
+SECTION_END = '<!-- /submission {0} -->\n'
+SECTION_PATTERN = re.compile(r'<!-- submission (\w+) -->\n(.*?)<!-- /submission \1 -->\n', re.DOTALL)
 
 
-def get_thumbnail(submission_number):
+def scan_submissions():
     """
-    Find the thumbnail image and return its path
+    Lists the collected submissions and their thumbnail images, in a single pass over SUBMISSIONS_DIR.
+    :return: dict, submission number -> path of the original thumbnail, or None
+    """
+    submissions = {}
+    for entry in os.scandir(SUBMISSIONS_DIR):
+        if not entry.is_dir() or entry.name.startswith('.'):
+            continue
+        submissions[entry.name] = None
+        for file in os.scandir(entry.path):
+            if file.name.startswith(THUMBNAIL_PREFIX):
+                submissions[entry.name] = file.path
+                break
+    return submissions
+
+
+def get_thumbnail(submission_number, original_path):
+    """
+    Makes a small copy of a thumbnail image, unless an up-to-date one exists, and return its path
     :param submission_number: str
+    :param original_path: str, the image the student submitted, or None
     :return: str
     """
-    for file in glob(os.path.join(SUBMISSIONS_DIR, submission_number, 'ThumbPi.*')):
-        return file
-    return 'http://placehold.it/200x200'
+    if original_path is None:
+        return PLACEHOLDER_PATH
+    thumbnail_path = os.path.join(THUMBNAILS_DIR, submission_number + '.png')
+    if not os.path.exists(thumbnail_path) or os.path.getmtime(thumbnail_path) < os.path.getmtime(original_path):
+        try:
+            with Image.open(original_path) as image:
+                image.thumbnail(THUMBNAIL_SIZE)
+                os.makedirs(THUMBNAILS_DIR, exist_ok=True)
+                tmp_path = thumbnail_path + '.tmp'
+                image.save(tmp_path, 'PNG')
+                os.replace(tmp_path, thumbnail_path)
+        except OSError as e:
+            print("> Cannot make a thumbnail of {0}: {1}".format(original_path, e))
+            return original_path
+    # The version makes browsers fetch a regenerated thumbnail
+    return "{0}?v={1}".format(thumbnail_path, int(os.path.getmtime(thumbnail_path)))
+
+
+def read_sections():
+    """
+    Reads the submission sections of the current page.
+    :return: dict, submission number -> section markup
+    """
+    try:
+        with open(OUTPUT_PATH) as f:
+            return {number: section for number, section in SECTION_PATTERN.findall(f.read())}
+    except FileNotFoundError:
+        return {}
 
 
 def main():
-    with open(HEADER_PATH) as header_file, open(TEMPLATE_PATH) as template_file, \
-            open(FOOTER_PATH) as footer_file, open(OUTPUT_PATH, 'w') as out_file:
+    with open(HEADER_PATH) as header_file, open(TEMPLATE_PATH) as template_file, open(FOOTER_PATH) as footer_file:
         header = header_file.read()
         footer = footer_file.read()
-        template_str = template_file.read()
-        template = Template(template_str)
-
-        out_file.write(header)
-        for number in SUBMISSIONS:
-            if number is None:
-                continue
-            thumbnail_path = get_thumbnail(number)
-            section = template.substitute({'submission_number': number, 'thumbnail_path': thumbnail_path})
-            out_file.write(section)
-        out_file.write(footer)
-        subprocess.call(['open', OUTPUT_PATH])
+        template = Template(template_file.read())
+    if Image is None:
+        raise RuntimeError('> Pillow is required to make the thumbnails, install it with `pip3 install Pillow`')
+
+    old_sections = read_sections()
+    page = [header]
+    n_changed = 0
+    submissions = scan_submissions()
+    for number in sorted(submissions):
+        thumbnail_path = get_thumbnail(number, submissions[number])
+        section = template.substitute({'submission_number': number, 'thumbnail_path': thumbnail_path})
+        if old_sections.get(number) != section:
+            n_changed += 1
+        page.append(SECTION_BEGIN.format(number) + section + SECTION_END.format(number))
+    page.append(footer)
+    page = ''.join(page)
+
+    removed = len(set(old_sections) - set(submissions))
+    print("> {0} submissions, {1} changed, {2} removed".format(len(submissions), n_changed, removed))
+    if os.path.exists(OUTPUT_PATH):
+        with open(OUTPUT_PATH) as f:
+            if f.read() == page:
+                return
+    tmp_path = OUTPUT_PATH + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(page)
+    os.replace(tmp_path, OUTPUT_PATH)
+    subprocess.call(['open', OUTPUT_PATH])
 
 
 if __name__ == '__main__':